@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+
+
+class TokenCache:
+    '''
+    LRU кеш токенов с пользователями в памяти процесса. Записи живут
+    ttl секунд, размер ограничен maxsize. Сигналы сбрасывают записи
+    только в своём процессе, поэтому другие процессы видят выход,
+    блокировку и смену пароля не позже чем через ttl. С shared=True
+    токены хранятся только в кеше Django, общем для всех процессов,
+    и сброс сразу виден всем.
+    '''
+
+    def __init__(self, maxsize, ttl, shared=False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def shared_key(key):
+        return f'auth-token:{key}'
+
+    def _record(self, result):
+        with self._lock:
+            if result == 'hit':
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.AUTH_TOKEN_CACHE.labels(result).inc()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, token = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def _set_local(self, key, token):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        '''
+        Возвращает копию закешированного токена, чтобы запросы не меняли
+        общий объект пользователя.
+        '''
+        if self.shared:
+            token = cache.get(self.shared_key(key))
+        else:
+            token = self._get_local(key)
+        self._record('miss' if token is None else 'hit')
+        return copy.deepcopy(token)
+
+    def set(self, key, token):
+        if self.shared:
+            cache.set(self.shared_key(key), token, timeout=self.ttl)
+        else:
+            self._set_local(key, copy.deepcopy(token))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared:
+            cache.delete(self.shared_key(key))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = [key for key, (_, token) in self._entries.items()
+                    if token.user_id == user_id]
+        if self.shared:
+            keys.extend(Token.objects.filter(user=user_id)
+                        .values_list('key', flat=True))
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'size': len(self._entries),
+            }
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                         settings.AUTH_TOKEN_CACHE_TTL,
+                         settings.AUTH_TOKEN_CACHE_SHARED)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication, который не ходит в базу, пока токен есть
+    в token_cache.
+    '''
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+            return user, token
+        return token.user, token
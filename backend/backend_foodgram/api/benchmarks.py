@@ -0,0 +1,41 @@
+import statistics
+import time
+
+from django.conf import settings
+from rest_framework.test import APIClient
+
+
+def measure(func, repeat):
+    '''
+    Вызывает func repeat раз и возвращает статистику времени выполнения
+    в миллисекундах.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max': timings[-1],
+    }
+
+
+def format_stats(title, stats):
+    return (f'{title}: mean {stats["mean"]:.3f} ms, '
+            f'p50 {stats["p50"]:.3f} ms, p95 {stats["p95"]:.3f} ms, '
+            f'max {stats["max"]:.3f} ms')
+
+
+def api_client(user=None):
+    '''
+    Клиент для замеров API вне тестов. Запросы идут с разрешённым
+    хостом, пользователь авторизуется без токена.
+    '''
+    client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    if user is not None:
+        client.force_authenticate(user)
+    return client
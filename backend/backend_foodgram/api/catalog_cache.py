@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_version(name):
+    '''
+    Версия справочника. Меняется при изменении справочника и по
+    истечении CATALOG_CACHE_TIMEOUT.
+    '''
+    key = f'catalog:{name}:version'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=settings.CATALOG_CACHE_TIMEOUT)
+        return cache.get(key)
+    return version
+
+
+def invalidate(name):
+    cache.delete(f'catalog:{name}:version')
+
+
+def get_content(name, version, render):
+    '''
+    Возвращает готовое содержимое ответа для версии справочника.
+    Если в кеше его нет, вызывает render() и сохраняет результат.
+    '''
+    key = f'catalog:{name}:{version}'
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return content
@@ -1,12 +1,19 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import CharFilter, FilterSet
-from recipes.models import Recipe
+from recipes import search
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
 from rest_framework import filters
 from rest_framework.exceptions import ValidationError
 
+from .ingredient_index import ingredient_index
+
 
 class IngredientFilter(filters.BaseFilterBackend):
     '''
     Фильтр для поиска ингредиента по начальным буквам. Регистронезависимый.
+    Для списка ищет по индексу в памяти процесса и возвращает список
+    ингредиентов, не обращаясь к базе. В остальных действиях, например
+    в get_object, фильтрует queryset.
     '''
     allowed_fields = ('name',)
 
@@ -14,13 +21,15 @@ class IngredientFilter(filters.BaseFilterBackend):
         if 'name' not in request.query_params:
             return queryset
         desired = request.query_params['name']
-        return queryset.filter(name__istartswith=desired).order_by('name')
+        if view.action == 'list':
+            return ingredient_index.search(desired)
+        return queryset.filter(name__istartswith=desired)
 
 
 class IsFavoritedFilter(filters.BaseFilterBackend):
     '''
     Фильтр для выборки рецептов по критерию добавлен/не добавлен
-    в избранное.
+    в избранное. Проверяет EXISTS, поэтому строки не размножаются.
     '''
 
     def filter_queryset(self, request, queryset, view):
@@ -30,16 +39,18 @@ class IsFavoritedFilter(filters.BaseFilterBackend):
             raise ValidationError(
                 'Параметр is_favorited должен быть равен 0 или 1'
             )
+        favorited = Exists(FavoriteRecipe.objects.filter(
+            user=request.user.pk, recipe=OuterRef('pk')
+        ))
         if int(request.query_params.get('is_favorited')) == 0:
-            queryset = queryset.exclude(users__user=request.user)
-            return queryset
-        return queryset.filter(users__user=request.user)
+            return queryset.filter(~favorited)
+        return queryset.filter(favorited)
 
 
 class IsInShoppingcartFilter(filters.BaseFilterBackend):
     '''
     Фильтр для выборки рецептов по критерию добавлен/не добавлен
-    в список покупок.
+    в список покупок. Проверяет EXISTS, поэтому строки не размножаются.
     '''
 
     def filter_queryset(self, request, queryset, view):
@@ -49,23 +60,66 @@ class IsInShoppingcartFilter(filters.BaseFilterBackend):
             raise ValidationError(
                 'Параметр is_in_shoppingcart должен быть равен 0 или 1'
             )
+        in_shopping_cart = Exists(ShoppingCart.recipes.through.objects.filter(
+            shoppingcart__user=request.user.pk, recipe=OuterRef('pk')
+        ))
         if int(request.query_params.get('is_in_shopping_cart')) == 0:
-            queryset = queryset.exclude(shopping_carts__user=request.user)
-            return queryset
-        return queryset.filter(shopping_carts__user=request.user)
+            return queryset.filter(~in_shopping_cart)
+        return queryset.filter(in_shopping_cart)
 
 
 class TagFilter(filters.BaseFilterBackend):
     '''
-    Фильтр по тегам
+    Фильтр по тегам. Рецепт подходит, если у него есть хотя бы один
+    из тегов. Проверяет EXISTS, поэтому DISTINCT не нужен.
     '''
 
     def filter_queryset(self, request, queryset, view):
         if 'tags' not in request.query_params:
             return queryset
-        return queryset.filter(
-            tags__slug__in=request.query_params.getlist('tags')
-        ).distinct()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__slug__in=request.query_params.getlist('tags')
+        )))
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    '''
+    Сортировка ленты рецептов. ordering=popular сортирует по количеству
+    добавлений в избранное, без параметра — по дате публикации.
+    '''
+    orderings = {'popular': ('-favorites_count', '-pub_date', '-id')}
+
+    def get_ordering(self, request, queryset, view):
+        if self.ordering_param not in request.query_params:
+            return self.get_default_ordering(view)
+        ordering = request.query_params[self.ordering_param]
+        if ordering not in self.orderings:
+            raise ValidationError(
+                f'Параметр {self.ordering_param} может быть равен только '
+                f'{", ".join(self.orderings)}'
+            )
+        return self.orderings[ordering]
+
+
+class RecipeSearchFilter(filters.BaseFilterBackend):
+    '''
+    Полнотекстовый поиск по названию, описанию и ингредиентам рецепта.
+    Без явной сортировки результаты идут по релевантности. Должен стоять
+    после RecipeOrderingFilter.
+    '''
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        queryset = search.search(queryset, text)
+        if ('search_rank' not in queryset.query.annotations
+                or RecipeOrderingFilter.ordering_param
+                in request.query_params):
+            return queryset
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
 
 
 class AuthorFilter(FilterSet):
@@ -0,0 +1,148 @@
+import hashlib
+from http import HTTPStatus
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import catalog_cache, recipe_cache
+
+
+def viewer_state(user):
+    '''
+    Поколение избранного, списка покупок и подписок пользователя.
+    Сигналы меняют его при любом добавлении или удалении записи.
+    '''
+    if user.is_anonymous:
+        return ()
+    return user.pk, recipe_cache.get_generation(
+        recipe_cache.viewer_key(user.pk)
+    )
+
+
+class ConditionalGetMixin:
+    '''
+    Отвечает 304 на GET списка и объекта, если ETag из If-None-Match
+    совпал. ETag строится до сериализации ответа из версий
+    get_list_version и get_object_version, по умолчанию это поколение
+    кеша рецептов, и не требует запросов к базе. Включается настройкой
+    RECIPE_ETAGS, только с общим для воркеров кешем.
+    '''
+
+    def get_list_version(self):
+        return recipe_cache.get_generation()
+
+    def get_object_version(self):
+        return recipe_cache.get_generation()
+
+    def get_etag(self, version):
+        request = self.request
+        parts = (request.get_full_path(), request.META.get('HTTP_ACCEPT'),
+                 version, viewer_state(request.user))
+        return f'"{hashlib.md5(repr(parts).encode()).hexdigest()}"'
+
+    def conditional_response(self, version, action, *args, **kwargs):
+        if version is None or not settings.RECIPE_ETAGS:
+            return action(self.request, *args, **kwargs)
+        etag = self.get_etag(version)
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = action(self.request, *args, **kwargs)
+        if response.status_code in (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_version(), super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_version(), super().retrieve, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    '''
+    Кеширует ответы на GET списка и объекта для анонимных пользователей.
+    Ключ строится по параметрам запроса, пагинацию приводит к
+    каноническому виду get_cache_params пагинатора. Кеш сбрасывается
+    сигналами. Включается настройкой RECIPE_ANONYMOUS_CACHE, только с
+    общим для воркеров кешем. Должен стоять перед ConditionalGetMixin.
+    '''
+
+    def cached_response(self, action, *args, **kwargs):
+        if not settings.RECIPE_ANONYMOUS_CACHE:
+            return action(self.request, *args, **kwargs)
+        key = None
+        pagination = {}
+        if self.action == 'list' and self.paginator is not None:
+            pagination = self.paginator.get_cache_params(self.request)
+        if self.request.user.is_anonymous and pagination is not None:
+            key = recipe_cache.make_key(
+                self.request, self.action, self.kwargs.get('pk'), pagination
+            )
+        if key is None:
+            return action(self.request, *args, **kwargs)
+        entry = recipe_cache.get_entry(key)
+        if entry is None:
+            response = action(self.request, *args, **kwargs)
+            if (isinstance(response, Response)
+                    and response.status_code == HTTPStatus.OK):
+                recipe_cache.set_entry(key, (response.data,
+                                             response.get('ETag')))
+            response['X-Cache'] = 'MISS'
+            return response
+        data, etag = entry
+        if etag is None:
+            response = Response(data)
+        else:
+            response = get_conditional_response(self.request, etag=etag)
+            if response is None:
+                response = Response(data)
+            response['ETag'] = etag
+        response['X-Cache'] = 'HIT'
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, *args, **kwargs)
+
+
+class CatalogCacheMixin:
+    '''
+    Отдаёт полный справочник готовым JSON из кеша с ETag и долгим
+    Cache-Control. Запросы с параметрами и не в JSON обрабатываются
+    как обычно.
+    '''
+    catalog_name = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        version = catalog_cache.get_version(self.catalog_name)
+        etag = f'"{self.catalog_name}-{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                catalog_cache.get_content(
+                    self.catalog_name, version, self.render_catalog
+                ),
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, public=True,
+                            max_age=settings.CATALOG_MAX_AGE)
+        return response
+
+    def render_catalog(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return JSONRenderer().render(serializer.data)
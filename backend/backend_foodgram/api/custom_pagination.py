@@ -1,5 +1,11 @@
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db import connections
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -9,3 +15,142 @@ class PageLimitPagination(PageNumberPagination):
     page_size = settings.PAGE_SIZE_CUSTOM_PAGINATOR
     page_size_query_param = 'limit'
     max_page_size = settings.MAX_PAGE_SIZE_CUSTOM_PAGINATOR
+
+
+class RecipeCursorPagination(CursorPagination):
+    '''
+    Курсорный пагинатор ленты рецептов. Курсор хранит значения всех полей
+    сортировки (например, pub_date и id) крайнего рецепта страницы, и
+    соседняя страница выбирается условием (pub_date, id) < (%s, %s) по
+    индексу, без OFFSET и без подсчёта общего количества. Поля сортировки
+    должны идти в одном направлении и вместе быть уникальными.
+    '''
+    page_size = settings.PAGE_SIZE_CUSTOM_PAGINATOR
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE_CUSTOM_PAGINATOR
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = self.get_fields(queryset.model)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = self.beyond(queryset, self.cursor.position, reverse)
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        has_cursor = (self.cursor is not None
+                      and self.cursor.position is not None)
+        self.has_next = has_cursor if reverse else has_more
+        self.has_previous = has_more if reverse else has_cursor
+        return self.page
+
+    def get_fields(self, model):
+        return [model._meta.get_field(name.lstrip('-'))
+                for name in self.ordering]
+
+    def beyond(self, queryset, position, reverse):
+        '''
+        Оставляет рецепты, которые идут после позиции курсора, а при
+        reverse — перед ней.
+        '''
+        try:
+            values = json.loads(position)
+            if len(values) != len(self.fields):
+                raise ValueError
+            values = [field.to_python(value)
+                      for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        connection = connections[queryset.db]
+        quote = connection.ops.quote_name
+        table = quote(queryset.model._meta.db_table)
+        columns = ', '.join(
+            f'{table}.{quote(field.column)}' for field in self.fields
+        )
+        placeholders = ', '.join('%s' for _ in self.fields)
+        descending = self.ordering[0].startswith('-')
+        operator = '<' if descending != reverse else '>'
+        return queryset.extra(
+            where=[f'({columns}) {operator} ({placeholders})'],
+            params=[field.get_db_prep_value(value, connection)
+                    for field, value in zip(self.fields, values)]
+        )
+
+    def get_position(self, recipe):
+        return json.dumps([field.value_to_string(recipe)
+                           for field in self.fields])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=self.get_position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=True, position=self.get_position(self.page[0])
+        ))
+
+
+class RecipePagination(PageLimitPagination):
+    '''
+    Пагинатор ленты рецептов. По умолчанию постраничный, с параметром
+    cursor (можно пустым) переключается на курсорную пагинацию.
+    '''
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_cache_params(self, request):
+        '''
+        Параметры пагинации в каноническом виде для ключа кеша: размер
+        страницы ограничен так же, как при выборке. None, если номер
+        страницы или курсор некорректны и ответ кешировать не нужно.
+        '''
+        if self.cursor_query_param in request.query_params:
+            paginator = RecipeCursorPagination()
+            try:
+                cursor = paginator.decode_cursor(request)
+            except NotFound:
+                return None
+            return {
+                'cursor': f'{int(cursor.reverse)}:{cursor.position or ""}',
+                'limit': paginator.get_page_size(request),
+            }
+        page = request.query_params.get(self.page_query_param, '1')
+        if page not in self.last_page_strings:
+            try:
+                page = int(page)
+            except ValueError:
+                return None
+            if page < 1:
+                return None
+        return {'page': page, 'limit': self.get_page_size(request)}
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+from abc import ABCMeta, abstractmethod
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    '''
+    Базовый рендерер списка покупок. Сам список отдаётся потоком
+    через stream(), render() нужен только для ответов с ошибками:
+    они всегда отдаются в JSON, какой бы формат ни запросил клиент.
+    '''
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer = JSONRenderer()
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = renderer.media_type
+        return renderer.render(data, renderer.media_type, renderer_context)
+
+    @abstractmethod
+    def stream(self, rows):
+        '''
+        Возвращает по частям файл со списком покупок.
+        '''
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for row in rows:
+            yield (f'{row["name"]}: {row["amount"]} '
+                   f'{row["measurement_unit"]}\n')
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('id', 'name', 'amount', 'measurement_unit')
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for row in rows:
+            writer.writerow([row[field] for field in self.header])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
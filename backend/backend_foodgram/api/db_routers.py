@@ -0,0 +1,95 @@
+import hashlib
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+
+@dataclass
+class Routing:
+    use_replica: bool = False
+    wrote: bool = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+def client_key(request):
+    '''
+    Ключ клиента для закрепления за основной базой: токен или сессия.
+    '''
+    credentials = (request.META.get('HTTP_AUTHORIZATION')
+                   or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    return 'db-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+# Настройки, которым нужен кеш, общий для всех воркеров gunicorn.
+SHARED_CACHE_SETTINGS = {
+    'DATABASE_REPLICAS': 'DB_REPLICAS',
+    'RECIPE_ETAGS': 'RECIPE_ETAGS',
+    'RECIPE_ANONYMOUS_CACHE': 'RECIPE_ANONYMOUS_CACHE',
+    'AUTH_TOKEN_CACHE_SHARED': 'AUTH_TOKEN_CACHE_SHARED',
+}
+
+
+def check_shared_cache():
+    '''
+    Закрепления за основной базой, поколения ETag и ответы анонимам
+    хранятся в кеше, и их должны видеть все воркеры gunicorn. С кешем в
+    памяти процесса клиент сразу после записи может прочитать
+    устаревшие данные с реплики или из кеша другого воркера.
+    '''
+    if not isinstance(caches['default'], (LocMemCache, DummyCache)):
+        return
+    enabled = [variable for name, variable in SHARED_CACHE_SETTINGS.items()
+               if getattr(settings, name)]
+    if enabled:
+        raise ImproperlyConfigured(
+            f'{", ".join(enabled)} requires a cache shared between '
+            'processes, set CACHE_BACKEND and CACHE_LOCATION'
+        )
+
+
+def pin(key):
+    cache.set(key, True, timeout=settings.DATABASE_PIN_SECONDS)
+
+
+def is_pinned(key):
+    return key is not None and cache.get(key, False)
+
+
+class ReplicaRouter:
+    '''
+    Отправляет чтение в GET и HEAD запросах на случайную реплику из
+    DATABASE_REPLICAS. Запись, чтение после записи в том же запросе
+    (в том числе select_for_update) и запросы клиента, который недавно
+    что-то менял, идут в основную базу.
+    '''
+
+    def db_for_read(self, model, **hints):
+        routing = routing_state.get()
+        if (routing is None or not routing.use_replica
+                or not settings.DATABASE_REPLICAS):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        routing = routing_state.get()
+        if routing is not None:
+            routing.use_replica = False
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
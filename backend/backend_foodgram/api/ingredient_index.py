@@ -0,0 +1,68 @@
+import threading
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+
+class IngredientPrefixIndex:
+    '''
+    Индекс ингредиентов в памяти процесса для поиска по началу названия.
+    Строится при первом обращении и сбрасывается сигналами при изменении
+    ингредиентов. Через ttl секунд индекс перестраивается, чтобы другие
+    процессы gunicorn тоже увидели изменения.
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = None
+        self._built_at = 0.0
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._rows = None
+
+    def _is_fresh(self):
+        return (self._rows is not None
+                and time.monotonic() - self._built_at < self.ttl)
+
+    def _get_rows(self):
+        if self._is_fresh():
+            return self._rows
+        with self._lock:
+            if self._is_fresh():
+                return self._rows
+            generation = self._generation
+            rows = sorted(
+                (name.casefold(), name, pk, measure)
+                for pk, name, measure in Ingredient.objects.values_list(
+                    'pk', 'name', 'measure'
+                ).iterator()
+            )
+            if generation == self._generation:
+                self._rows = rows
+                self._built_at = time.monotonic()
+            return rows
+
+    def search(self, prefix):
+        '''
+        Возвращает ингредиенты, название которых начинается с prefix.
+        Поиск регистронезависимый.
+        '''
+        rows = self._get_rows()
+        prefix = prefix.casefold()
+        result = []
+        start = bisect_left(rows, prefix, key=itemgetter(0))
+        for index in range(start, len(rows)):
+            key, name, pk, measure = rows[index]
+            if not key.startswith(prefix):
+                break
+            result.append(Ingredient(pk=pk, name=name, measure=measure))
+        return result
+
+
+ingredient_index = IngredientPrefixIndex(ttl=settings.INGREDIENT_INDEX_TTL)
@@ -0,0 +1,146 @@
+import json
+from itertools import combinations
+from pathlib import Path
+
+from django.core import management
+from django.db import connection
+from django.db.models import Count
+from recipes.models import Ingredient, Tag
+from users.models import CustomUser
+
+from ...benchmarks import api_client, format_stats, measure
+from ...middleware import QueryTimer
+
+RECIPE_FILTERS = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+
+class Command(management.base.BaseCommand):
+    help = ('Замеряет задержку и количество запросов к базе для основных '
+            'эндпоинтов API и сохраняет отчёт в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--user',
+            help='Логин пользователя, от имени которого идут запросы. '
+                 'По умолчанию пользователь с наибольшим числом подписок'
+        )
+        parser.add_argument('--output', default='benchmark_api.json')
+        parser.add_argument(
+            '--compare',
+            help='Отчёт предыдущего запуска для сравнения. Рост числа '
+                 'запросов к базе считается ошибкой'
+        )
+
+    def get_user(self, username):
+        if username:
+            try:
+                return CustomUser.objects.get(username=username)
+            except CustomUser.DoesNotExist:
+                raise management.base.CommandError(
+                    f'Пользователь {username} не найден'
+                )
+        user = CustomUser.objects.annotate(
+            subscriptions=Count('authors')
+        ).order_by('-subscriptions', 'pk').first()
+        if user is None:
+            raise management.base.CommandError(
+                'В базе нет пользователей, заполните её командой seed_load'
+            )
+        return user
+
+    def recipe_params(self, user):
+        '''
+        Значения фильтров ленты рецептов для пользователя.
+        '''
+        author = (user.authors.values_list('author', flat=True).first()
+                  or user.pk)
+        return {
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'author': author,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+
+    def endpoints(self, user):
+        params = self.recipe_params(user)
+        for size in range(len(RECIPE_FILTERS) + 1):
+            for names in combinations(RECIPE_FILTERS, size):
+                name = 'recipes' + ''.join(f' {name}' for name in names)
+                yield name, '/api/recipes/', {
+                    name: params[name] for name in names
+                }
+        names = Ingredient.objects.values_list('name', flat=True)[:1]
+        for prefix in sorted({name[:length] for name in names
+                              for length in (1, 3)}):
+            yield (f'ingredients name={prefix}', '/api/ingredients/',
+                   {'name': prefix})
+        yield ('subscriptions recipes_limit=3', '/api/users/subscriptions/',
+               {'recipes_limit': 3})
+        for file_format in ('txt', 'json'):
+            yield (f'download_shopping_cart {file_format}',
+                   '/api/recipes/download_shopping_cart/',
+                   {'format': file_format})
+
+    def run(self, client, url, params):
+        response = client.get(url, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def benchmark(self, user, repeat):
+        client = api_client(user)
+        results = {}
+        for name, url, params in self.endpoints(user):
+            self.run(client, url, params)
+            timer = QueryTimer()
+            with timer.installed():
+                response = self.run(client, url, params)
+            stats = measure(lambda: self.run(client, url, params), repeat)
+            results[name] = {
+                'url': url,
+                'params': params,
+                'status': response.status_code,
+                'queries': timer.count,
+                **{key: round(value, 3) for key, value in stats.items()},
+            }
+            self.stdout.write(format_stats(
+                f'{name}: {results[name]["queries"]} queries', stats
+            ))
+        return results
+
+    def compare(self, path, results):
+        previous = json.loads(Path(path).read_text())['endpoints']
+        regressions = []
+        for name, result in results.items():
+            old = previous.get(name)
+            if old is None:
+                continue
+            self.stdout.write(
+                f'{name}: p50 {old["p50"]} -> {result["p50"]} ms, '
+                f'p95 {old["p95"]} -> {result["p95"]} ms, '
+                f'queries {old["queries"]} -> {result["queries"]}'
+            )
+            if result['queries'] > old['queries']:
+                regressions.append(name)
+        if regressions:
+            raise management.base.CommandError(
+                f'Выросло число запросов к базе: {", ".join(regressions)}'
+            )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        self.stdout.write(f'База: {connection.vendor}, пользователь: '
+                          f'{user.username}, повторов: {options["repeat"]}')
+        results = self.benchmark(user, options['repeat'])
+        report = {
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'endpoints': results,
+        }
+        Path(options['output']).write_text(
+            json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+        )
+        self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results)
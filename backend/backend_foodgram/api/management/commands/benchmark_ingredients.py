@@ -0,0 +1,52 @@
+from django.core import management
+from recipes.models import Ingredient
+
+from ...benchmarks import format_stats, measure
+from ...ingredient_index import ingredient_index
+
+
+class Command(management.base.BaseCommand):
+    help = ('Сравнивает поиск ингредиентов по началу названия через ORM '
+            'и через индекс в памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument(
+            '--prefix', action='append', dest='prefixes',
+            help='Префикс для поиска, можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        prefixes = options['prefixes']
+        if not prefixes:
+            names = Ingredient.objects.values_list('name', flat=True)[:50]
+            prefixes = sorted({name[:length] for name in names
+                               for length in (1, 3) if name})
+        if not prefixes:
+            raise management.base.CommandError('Нет ингредиентов в базе')
+
+        def orm_search():
+            for prefix in prefixes:
+                list(Ingredient.objects.filter(name__istartswith=prefix)
+                     .order_by('name'))
+
+        def index_search():
+            for prefix in prefixes:
+                ingredient_index.search(prefix)
+
+        def build_index():
+            ingredient_index.invalidate()
+            ingredient_index.search(prefixes[0])
+
+        repeat = options['repeat']
+        self.stdout.write(
+            f'Ингредиентов: {Ingredient.objects.count()}, '
+            f'префиксов: {len(prefixes)}, повторов: {repeat}'
+        )
+        self.stdout.write(format_stats('ORM', measure(orm_search, repeat)))
+        self.stdout.write(format_stats(
+            'Index build', measure(build_index, min(repeat, 10))
+        ))
+        self.stdout.write(
+            format_stats('Index', measure(index_search, repeat))
+        )
@@ -0,0 +1,104 @@
+import uuid
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from django.core import management
+from django.db import transaction
+from recipes.models import Recipe
+from rest_framework.pagination import Cursor
+from users.models import CustomUser
+
+from ...benchmarks import api_client, format_stats, measure
+from ...custom_pagination import RecipeCursorPagination
+
+
+class Command(management.base.BaseCommand):
+    help = ('Сравнивает постраничную и курсорную пагинацию '
+            '/api/recipes/ на глубоких страницах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1_000_000,
+            help='Сколько рецептов должно быть в базе, недостающие '
+                 'создаются на время замера'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Оставить созданные рецепты в базе'
+        )
+
+    def seed(self, total, batch_size):
+        author, _ = CustomUser.objects.get_or_create(
+            username='benchmark', email='benchmark@fake.fake',
+            defaults={'first_name': 'Bench', 'last_name': 'Mark'}
+        )
+        missing = total - Recipe.objects.count()
+        while missing > 0:
+            size = min(batch_size, missing)
+            Recipe.objects.bulk_create(
+                Recipe(author=author, name=f'Benchmark {uuid.uuid4().hex}',
+                       text='Benchmark recipe', cooking_time=10,
+                       image='recipes/images/benchmark.png')
+                for _ in range(size)
+            )
+            missing -= size
+        return author
+
+    def cursor_for_offset(self, offset):
+        '''
+        Курсор страницы, которая начинается с рецепта номер offset,
+        в том же формате, что и ссылки next в ответах API.
+        '''
+        if not offset:
+            return ''
+        paginator = RecipeCursorPagination()
+        paginator.base_url = '/api/recipes/'
+        paginator.fields = paginator.get_fields(Recipe)
+        pub_date, pk = Recipe.objects.order_by(
+            *paginator.ordering
+        ).values_list('pub_date', 'id')[offset - 1]
+        link = paginator.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=paginator.get_position(Recipe(pub_date=pub_date, pk=pk))
+        ))
+        return parse_qs(urlsplit(link).query)[paginator.cursor_query_param][0]
+
+    def get(self, client, params):
+        response = client.get('/api/recipes/', params)
+        if response.status_code != HTTPStatus.OK:
+            raise management.base.CommandError(
+                f'/api/recipes/ с параметрами {params} вернул '
+                f'{response.status_code}'
+            )
+        return response
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            client = api_client(
+                self.seed(options['recipes'], options['batch_size'])
+            )
+            limit = options['limit']
+            total = Recipe.objects.count()
+            last_page = max(1, (total + limit - 1) // limit)
+            self.stdout.write(f'Рецептов: {total}, limit: {limit}')
+            for page in sorted({1, last_page // 2 or 1, last_page}):
+                offset = (page - 1) * limit
+                cursor = self.cursor_for_offset(offset)
+                offset_stats = measure(
+                    lambda: self.get(client, {'page': page, 'limit': limit}),
+                    options['repeat']
+                )
+                cursor_stats = measure(
+                    lambda: self.get(client,
+                                     {'cursor': cursor, 'limit': limit}),
+                    options['repeat']
+                )
+                self.stdout.write(format_stats(f'page={page} offset',
+                                               offset_stats))
+                self.stdout.write(format_stats(f'page={page} cursor',
+                                               cursor_stats))
+            if not options['keep']:
+                transaction.set_rollback(True)
@@ -0,0 +1,44 @@
+from django.core import management
+from django.db import connection
+from recipes import search
+from recipes.models import Recipe
+
+from ...benchmarks import api_client, format_stats, measure
+
+
+class Command(management.base.BaseCommand):
+    help = 'Замеряет время поиска рецептов через ORM и через API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--query', action='append', dest='queries',
+            help='Поисковая строка, можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        queries = options['queries']
+        if not queries:
+            names = Recipe.objects.values_list('name', flat=True)[:20]
+            queries = sorted({name.split()[0] for name in names if name})
+        if not queries:
+            raise management.base.CommandError('Нет рецептов в базе')
+        client = api_client()
+
+        def orm_search():
+            for query in queries:
+                list(search.search(Recipe.objects.all(), query)[:10])
+
+        def api_search():
+            for query in queries:
+                client.get('/api/recipes/', {'search': query})
+
+        repeat = options['repeat']
+        mode = 'tsvector' if search.is_supported() else 'LIKE'
+        self.stdout.write(
+            f'База: {connection.vendor}, поиск: {mode}, '
+            f'рецептов: {Recipe.objects.count()}, '
+            f'запросов: {len(queries)}, повторов: {repeat}'
+        )
+        self.stdout.write(format_stats('ORM', measure(orm_search, repeat)))
+        self.stdout.write(format_stats('API', measure(api_search, repeat)))
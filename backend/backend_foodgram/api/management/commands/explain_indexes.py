@@ -0,0 +1,152 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.core import management
+from django.db import connection, transaction
+from django.utils import timezone
+from recipes.models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
+                            ShoppingCart, ShoppingCartRecipe)
+from users.models import CustomUser, Subscribe
+
+from ...benchmarks import format_stats, measure
+
+
+class Command(management.base.BaseCommand):
+    help = ('Заполняет базу тестовыми данными и проверяет через EXPLAIN, '
+            'что запросы API используют индексы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument(
+            '--per-user', type=int, default=20,
+            help='Сколько избранных, рецептов в корзине и подписок '
+                 'создать каждому пользователю'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Оставить созданные данные в базе'
+        )
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size,
+                                  ignore_conflicts=True)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        prefix = uuid.uuid4().hex[:8]
+        self.bulk_create(CustomUser, (
+            CustomUser(username=f'explain_{prefix}_{i}',
+                       email=f'explain_{prefix}_{i}@fake.fake')
+            for i in range(options['users'])
+        ))
+        users = list(CustomUser.objects.filter(
+            username__startswith=f'explain_{prefix}_'
+        ).values_list('pk', flat=True))
+        self.bulk_create(ShoppingCart, (
+            ShoppingCart(user_id=pk) for pk in users
+        ))
+        self.bulk_create(Ingredient, (
+            Ingredient(name=f'explain {prefix} {i}', measure='g')
+            for i in range(500)
+        ))
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        self.bulk_create(Recipe, (
+            Recipe(author_id=rng.choice(users), name=f'Explain {prefix} {i}',
+                   text='Explain recipe', cooking_time=10,
+                   image='recipes/images/explain.png')
+            for i in range(options['recipes'])
+        ))
+        recipes = list(Recipe.objects.filter(
+            name__startswith=f'Explain {prefix} '
+        ).values_list('pk', flat=True))
+        self.bulk_create(Quantity, (
+            Quantity(recipe_id=recipe, ingredient_id=ingredient,
+                     amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(ingredients, 5)
+        ))
+        carts = dict(ShoppingCart.objects.filter(user__in=users)
+                     .values_list('user', 'pk'))
+        now = timezone.now()
+        per_user = options['per_user']
+        self.bulk_create(FavoriteRecipe, (
+            FavoriteRecipe(user_id=user, recipe_id=recipe,
+                           added_at=now - timedelta(hours=rng.randint(0, 720)))
+            for user in users for recipe in rng.sample(recipes, per_user)
+        ))
+        self.bulk_create(ShoppingCartRecipe, (
+            ShoppingCartRecipe(shoppingcart_id=carts[user], recipe_id=recipe)
+            for user in users for recipe in rng.sample(recipes, per_user)
+        ))
+        self.bulk_create(Subscribe, (
+            Subscribe(subscriber_id=user, author_id=author)
+            for user in users
+            for author in rng.sample(users, per_user) if author != user
+        ))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return rng.choice(users), rng.choice(recipes), rng.choice(ingredients)
+
+    def checks(self, user, recipe, ingredient):
+        '''
+        Запросы API и индексы, которые они должны использовать.
+        '''
+        since = timezone.now() - timedelta(days=3)
+        return (
+            ('Лента рецептов', 'recipe_pub_date_id_idx',
+             Recipe.objects.order_by('-pub_date', '-id')[:6]),
+            ('Рецепты автора', 'recipe_author_pub_date_idx',
+             Recipe.objects.filter(author=user).order_by('-pub_date')[:3]),
+            ('Избранное рецепта', 'favorite_recipe_user_idx',
+             FavoriteRecipe.objects.filter(recipe=recipe).values('user')),
+            ('Избранное за период', 'favorite_added_at_idx',
+             FavoriteRecipe.objects.filter(added_at__gte=since)
+             .values('recipe')),
+            ('Корзины с рецептом', 'cart_recipe_cart_idx',
+             ShoppingCartRecipe.objects.filter(recipe=recipe)
+             .values('shoppingcart')),
+            ('Корзины за период', 'cart_added_at_idx',
+             ShoppingCartRecipe.objects.filter(added_at__gte=since)
+             .values('recipe')),
+            ('Рецепты с ингредиентом', 'quantity_ingredient_idx',
+             Quantity.objects.filter(ingredient=ingredient)
+             .values('recipe', 'amount')),
+            ('Подписки пользователя', 'subscribe_subscriber_idx',
+             Subscribe.objects.filter(subscriber=user).values('author')),
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        missing = []
+        with transaction.atomic():
+            checks = self.checks(*self.seed(options))
+            self.stdout.write(
+                f'База: {connection.vendor}, рецептов: '
+                f'{Recipe.objects.count()}, избранного: '
+                f'{FavoriteRecipe.objects.count()}'
+            )
+            for title, index, queryset in checks:
+                plan = queryset.explain()
+                used = index in plan
+                if not used:
+                    missing.append(title)
+                self.stdout.write(
+                    f'\n{title}: {index} '
+                    f'{"используется" if used else "НЕ используется"}\n'
+                    f'{plan}'
+                )
+                self.stdout.write(format_stats(
+                    title, measure(lambda: list(queryset.all()),
+                                   options['repeat'])
+                ))
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if missing:
+            raise management.base.CommandError(
+                f'Индексы не используются: {", ".join(missing)}'
+            )
@@ -0,0 +1,60 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LABELS = ('view', 'method')
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса',
+    (*LABELS, 'status')
+)
+DB_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'Количество запросов к базе за запрос',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float('inf'))
+)
+DB_DURATION = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Время запросов к базе за запрос',
+    LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+             2.5, float('inf'))
+)
+AUTH_TOKEN_CACHE = Counter(
+    'foodgram_auth_token_cache',
+    'Обращения к кешу токенов авторизации',
+    ('result',)
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'foodgram_db_connections_opened',
+    'Открытые соединения с базой',
+    ('alias',)
+)
+DB_CONNECTIONS_REUSED = Counter(
+    'foodgram_db_connections_reused',
+    'Запросы, начатые с уже открытым соединением с базой',
+    ('alias',)
+)
+
+
+def observe(view, method, status, duration, queries, db_duration):
+    REQUEST_DURATION.labels(view, method, status).observe(duration)
+    DB_QUERIES.labels(view, method).observe(queries)
+    DB_DURATION.labels(view, method).observe(db_duration)
+
+
+def render():
+    '''
+    Метрики в текстовом формате Prometheus. Если задан
+    PROMETHEUS_MULTIPROC_DIR, собирает значения всех воркеров gunicorn
+    из файлов в этой папке.
+    '''
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
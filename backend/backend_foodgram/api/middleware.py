@@ -0,0 +1,105 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+from . import metrics
+from .db_routers import Routing, client_key, is_pinned, pin, routing_state
+
+
+class QueryTimer:
+    '''
+    execute_wrapper, который считает запросы к базе и их время.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    @contextmanager
+    def installed(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+def view_name(request):
+    '''
+    Имя маршрута из URLconf, например api:recipes-list. Имён конечное
+    число, поэтому метрики не разрастаются от параметров в пути.
+    '''
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    '''
+    Записывает в метрики время запроса, количество и время запросов
+    к базе для каждого обработчика. Для потоковых ответов замер
+    заканчивается, когда ответ полностью отдан.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with timer.installed():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, timer, start
+            )
+        else:
+            self.observe(request, response, timer, start)
+        return response
+
+    def stream(self, content, request, response, timer, start):
+        try:
+            with timer.installed():
+                yield from content
+        finally:
+            self.observe(request, response, timer, start)
+
+    def observe(self, request, response, timer, start):
+        metrics.observe(view_name(request), request.method,
+                        response.status_code, time.perf_counter() - start,
+                        timer.count, timer.duration)
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Разрешает ReplicaRouter читать из реплик в GET и HEAD запросах.
+    После изменяющего запроса клиент на DATABASE_PIN_SECONDS
+    закрепляется за основной базой, чтобы видеть свои изменения.
+    '''
+    safe_methods = ('GET', 'HEAD')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = client_key(request)
+        routing = Routing(use_replica=(request.method in self.safe_methods
+                                       and not is_pinned(key)))
+        token = routing_state.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        if key is not None and (request.method not in self.safe_methods
+                                or routing.wrote):
+            pin(key)
+        return response
@@ -0,0 +1,81 @@
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'recipes:generation'
+STATS_KEYS = {'hits': 'recipes:hits', 'misses': 'recipes:misses'}
+PAGINATION_PARAMS = ('page', 'limit', 'cursor')
+CACHED_PARAMS = ('tags', 'author', *PAGINATION_PARAMS)
+
+
+def get_generation(key=GENERATION_KEY):
+    '''
+    Поколение кеша. Живёт не дольше RECIPE_CACHE_TIMEOUT, поэтому
+    изменения в обход сигналов (bulk_create, update) видны не позже.
+    '''
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=settings.RECIPE_CACHE_TIMEOUT)
+        return cache.get(key)
+    return generation
+
+
+def invalidate(key=GENERATION_KEY):
+    '''
+    Сбрасывает все закешированные ответы, меняя поколение кеша.
+    '''
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=settings.RECIPE_CACHE_TIMEOUT)
+
+
+def viewer_key(user_id):
+    '''
+    Ключ поколения избранного, списка покупок и подписок пользователя.
+    '''
+    return f'{GENERATION_KEY}:viewer:{user_id}'
+
+
+def make_key(request, action, pk=None, pagination=None):
+    '''
+    Ключ кеша для анонимного GET запроса. Вместо page, limit и cursor из
+    запроса в ключ идут параметры пагинации pagination, приведённые
+    пагинатором к каноническому виду. Возвращает None, если в запросе
+    есть параметры, ответ на которые не кешируется.
+    '''
+    params = request.query_params
+    if not set(params) <= set(CACHED_PARAMS):
+        return None
+    query = urlencode(sorted(
+        [(name, sorted(params.getlist(name))) for name in params
+         if name not in PAGINATION_PARAMS]
+        + [(name, [value]) for name, value in (pagination or {}).items()]
+    ), doseq=True)
+    return (f'recipes:{get_generation()}:{request.get_host()}:{action}:'
+            f'{pk}:{query}')
+
+
+def get_entry(key):
+    entry = cache.get(key)
+    record('hits' if entry is not None else 'misses')
+    return entry
+
+
+def set_entry(key, entry):
+    cache.set(key, entry, timeout=settings.RECIPE_CACHE_TIMEOUT)
+
+
+def record(event):
+    key = STATS_KEYS[event]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def stats():
+    return {event: cache.get(key, 0) for event, key in STATS_KEYS.items()}
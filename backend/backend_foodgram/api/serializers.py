@@ -1,8 +1,11 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
 from django.db.utils import IntegrityError
 from djoser.serializers import UserSerializer
+from recipes import search, shopping_list
 from recipes.models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
                             ShoppingCart, Tag)
 from rest_framework import serializers
@@ -38,7 +41,8 @@ class Base64ImageField(serializers.ImageField):
 class SubscribeTrueOrFalseSerializer(serializers.ModelSerializer):
     '''
     Проверяет подписан или нет текущий юзер на автора. Если подписан
-    возвращает True, иначе возвращает False
+    возвращает True, иначе возвращает False. Если в контексте есть
+    subscribed_authors, берёт ответ из него без запроса в базу.
     '''
     author = serializers.IntegerField(source='author.pk', required=False)
     subscriber = serializers.IntegerField(source='subscriber.pk',
@@ -52,6 +56,9 @@ class SubscribeTrueOrFalseSerializer(serializers.ModelSerializer):
         currentuser = self.context.get('request').user
         if currentuser.is_anonymous:
             return False
+        subscribed_authors = self.context.get('subscribed_authors')
+        if subscribed_authors is not None:
+            return instance.instance.pk in subscribed_authors
         return (instance.instance
                 .subscribers.filter(subscriber=currentuser).exists())
 
@@ -77,8 +84,7 @@ class QuantitySerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='ingredient.name', read_only=True)
     measurement_unit = serializers.CharField(source='ingredient.measure',
                                              read_only=True)
-    id = serializers.PrimaryKeyRelatedField(source='ingredient.pk',
-                                            queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient.pk')
 
     class Meta:
         model = Quantity
@@ -100,6 +106,7 @@ class TagSerializer(serializers.ModelSerializer):
 class FavoriteSerializer(serializers.ModelSerializer):
     '''
     Возвращает True если рецепт добавлен в избранное, иначе False.
+    Использует аннотацию is_favorited из queryset, если она есть.
     '''
     user = serializers.ImageField(source='user.pk', required=False)
     recipe = serializers.IntegerField(source='recipe.pk', required=False)
@@ -112,12 +119,16 @@ class FavoriteSerializer(serializers.ModelSerializer):
         currentuser = self.context.get('request').user
         if currentuser.is_anonymous:
             return False
-        return instance.instance.users.filter(user=currentuser).exists()
+        recipe = instance.instance
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
+        return recipe.users.filter(user=currentuser).exists()
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
     '''
     Возвращает True если рецепт добавлен в список покупок, иначе False.
+    Использует аннотацию is_in_shopping_cart из queryset, если она есть.
     '''
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     recipes = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -129,9 +140,11 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         currentuser = self.context.get('request').user
         if currentuser.is_anonymous:
-            False
-        return (instance.instance
-                .shopping_carts.filter(user=currentuser).exists())
+            return False
+        recipe = instance.instance
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
+        return recipe.shopping_carts.filter(user=currentuser).exists()
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -149,120 +162,134 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'favorites_count', 'search_vector')
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     '''
-    Сериализатор для POST и PATCH запросов.
+    Сериализатор для POST и PATCH запросов. Ингредиенты и теги
+    проверяются одним запросом на каждую таблицу.
     '''
     author = serializers.PrimaryKeyRelatedField(
         default=serializers.CurrentUserDefault(),
         read_only=True
     )
     ingredients = QuantitySerializer(source='quantity_set', many=True)
+    tags = serializers.ListField(child=serializers.IntegerField(),
+                                 allow_empty=False, write_only=True)
     image = Base64ImageField(required=True)
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', )
+        exclude = ('pub_date', 'favorites_count', 'search_vector')
 
     def validate(self, attrs):
         if not attrs['quantity_set']:
             raise ValidationError('You need add any ingredients.')
-        ingredients = []
+        ingredient_ids = []
         for item in attrs['quantity_set']:
-            ingredient = item['ingredient']['pk']
-            ingredients.append(ingredient)
+            ingredient_ids.append(item['ingredient']['pk'])
             if item['amount'] <= 0:
                 raise ValidationError('Количество не может быть 0 или '
                                       'отрицательным значением.')
-        if len(ingredients) != len(set(ingredients)):
+        if len(ingredient_ids) != len(set(ingredient_ids)):
             raise ValidationError('Ингредиенты не должны повторяться.')
-        ingredients_id_for_check = [
-            ingredient.pk for ingredient in ingredients
-        ]
-        if not Ingredient.objects.filter(pk__in=ingredients_id_for_check):
-            raise ValidationError('Проверьте, что ингредиенты '
-                                  'существуют в базе')
         if len(attrs['tags']) != len(set(attrs['tags'])):
             raise ValidationError('Теги не должны повторяться')
-        tags_for_check = [tag.pk for tag in attrs['tags']]
-        if not Tag.objects.filter(pk__in=tags_for_check).exists():
-            raise ValidationError('Проверьте, что теги существуют.')
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        tags = Tag.objects.in_bulk(attrs['tags'])
+        errors = {}
+        missing_ingredients = [
+            pk for pk in ingredient_ids if pk not in ingredients
+        ]
+        if missing_ingredients:
+            errors['ingredients'] = [
+                f'Ингредиент с id {pk} не существует в базе'
+                for pk in missing_ingredients
+            ]
+        missing_tags = [pk for pk in attrs['tags'] if pk not in tags]
+        if missing_tags:
+            errors['tags'] = [
+                f'Тег с id {pk} не существует' for pk in missing_tags
+            ]
+        if errors:
+            raise ValidationError(errors)
+        for item in attrs['quantity_set']:
+            item['ingredient']['pk'] = ingredients[item['ingredient']['pk']]
+        attrs['tags'] = [tags[pk] for pk in attrs['tags']]
         return super().validate(attrs)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('quantity_set')
         tags = validated_data.pop('tags')
         validated_data['author'] = self.context.get('request').user
         recipe = Recipe.objects.create(**validated_data)
-        tags = [tag.pk for tag in tags]
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            ingredient, amount = ingredient.items()
-            ingredient = ingredient[1]['pk']
-            amount = amount[1]
-            obj, created = Quantity.objects.get_or_create(
-                recipe=recipe, ingredient=ingredient,
-                defaults={'amount': amount}
-            )
-            if created is not True:
-                obj.amount += amount
-                obj.save()
+        Quantity.objects.bulk_create(
+            Quantity(recipe=recipe, ingredient=item['ingredient']['pk'],
+                     amount=item['amount'])
+            for item in ingredients
+        )
+        search.schedule_update([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.quantity_set.all().delete()
-        ingredients = validated_data.pop('quantity_set')
-        tags = validated_data.pop('tags')
-        Recipe.objects.filter(pk=instance.pk).update(**validated_data)
-        recipe = Recipe.objects.get(pk=instance.pk)
-        tags = [tag.pk for tag in tags]
-        recipe.tags.set(tags)
-        for ingredient in ingredients:
-            ingredient, amount = ingredient.items()
-            ingredient = ingredient[1]['pk']
-            amount = amount[1]
-            obj, created = Quantity.objects.get_or_create(
-                recipe=recipe, ingredient=ingredient,
-                defaults={'amount': amount}
-            )
-            if created is not True:
-                obj.amount += amount
-                obj.save()
-        return recipe
+        ingredients = {
+            item['ingredient']['pk'].pk: item['amount']
+            for item in validated_data.pop('quantity_set')
+        }
+        instance.tags.set(validated_data.pop('tags'))
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save()
+        to_update = []
+        to_delete = []
+        deltas = {}
+        for quantity in instance.quantity_set.all():
+            amount = ingredients.pop(quantity.ingredient_id, 0)
+            if amount != quantity.amount:
+                deltas[quantity.ingredient_id] = amount - quantity.amount
+            if not amount:
+                to_delete.append(quantity.pk)
+            elif amount != quantity.amount:
+                quantity.amount = amount
+                to_update.append(quantity)
+        # Удаление без сигналов по каждой строке: списки покупок
+        # поправятся одним change_recipe вместе с остальными изменениями.
+        Quantity.objects.filter(pk__in=to_delete)._raw_delete(
+            instance._state.db
+        )
+        Quantity.objects.bulk_update(to_update, ('amount',))
+        Quantity.objects.bulk_create(
+            Quantity(recipe=instance, ingredient_id=pk, amount=amount)
+            for pk, amount in ingredients.items()
+        )
+        deltas.update(ingredients)
+        shopping_list.change_recipe(instance.pk, deltas)
+        search.schedule_update([instance.pk])
+        instance.refresh_from_db()
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags',
+            Prefetch('quantity_set',
+                     queryset=Quantity.objects.select_related('ingredient'))
+        )
         serializer = RecipeSerializer(context=self.context)
         return serializer.to_representation(instance)
 
 
-class FilterRecipesLimitSerializer(serializers.ListSerializer):
-    '''
-    Фильтр для вложенного сериализатора. Ограничивает количество рецептов
-    автора показываемых в ответе.
-    '''
-    def to_representation(self, data):
-        if 'recipes_limit' not in self.context.get('request').query_params:
-            return super().to_representation(data)
-        try:
-            recipes_limit = int(
-                self.context.get('request').query_params.get('recipes_limit')
-            )
-        except ValueError:
-            raise ValidationError('recipes_limit должен быть целым числом')
-        return super().to_representation(data)[:recipes_limit]
-
-
 class RecipeSubscriptionsSerializer(serializers.ModelSerializer):
     '''
-    Вложенный сериализатор. Возвращает рецепты автора.
+    Вложенный сериализатор. Возвращает рецепты автора. Ограничение
+    recipes_limit применяется во view при выборке рецептов.
     '''
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
-        list_serializer_class = FilterRecipesLimitSerializer
 
 
 class SubscriptionsSerializer(SpecialUserSerializer):
@@ -332,6 +359,9 @@ class ShoppingCartPostDeleteSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(
         read_only=True, default=serializers.CurrentUserDefault()
     )
+    recipes = serializers.PrimaryKeyRelatedField(
+        many=True, allow_empty=False, queryset=Recipe.objects.all()
+    )
 
     class Meta:
         model = ShoppingCart
@@ -359,9 +389,14 @@ class FavoritePostDeleteSerializer(serializers.ModelSerializer):
         model = FavoriteRecipe
         fields = ('id', 'recipe', 'user')
 
+    @transaction.atomic
     def create(self, validated_data):
         try:
-            inst = super().create(validated_data)
+            with transaction.atomic():
+                inst = super().create(validated_data)
         except IntegrityError:
             raise ValidationError('Этот рецепт уже добавлен в избранное')
+        Recipe.objects.filter(pk=inst.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
         return inst
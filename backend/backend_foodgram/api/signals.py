@@ -0,0 +1,123 @@
+from functools import partial
+
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
+                            ShoppingCart, ShoppingCartRecipe, Tag)
+from recipes.signals import bulk_changed
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser, Subscribe
+
+from . import catalog_cache, metrics, recipe_cache
+from .authentication import token_cache
+from .ingredient_index import ingredient_index
+
+
+@receiver((post_save, post_delete, bulk_changed), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete, bulk_changed), sender=Ingredient)
+def invalidate_ingredient_catalog(sender, **kwargs):
+    catalog_cache.invalidate('ingredients')
+    transaction.on_commit(lambda: catalog_cache.invalidate('ingredients'))
+
+
+@receiver((post_save, post_delete, bulk_changed), sender=Tag)
+def invalidate_tag_catalog(sender, **kwargs):
+    catalog_cache.invalidate('tags')
+    transaction.on_commit(lambda: catalog_cache.invalidate('tags'))
+
+
+@receiver((post_save, post_delete, bulk_changed), sender=Recipe)
+@receiver((post_save, post_delete), sender=Quantity)
+@receiver((post_save, post_delete, bulk_changed), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_cache(sender, **kwargs):
+    recipe_cache.invalidate()
+    transaction.on_commit(recipe_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=CustomUser)
+def invalidate_recipe_cache_on_user_change(sender, created=False,
+                                           update_fields=None, **kwargs):
+    public_fields = {'username', 'first_name', 'last_name', 'email'}
+    if created or (update_fields is not None
+                   and not public_fields & set(update_fields)):
+        return
+    invalidate_recipe_cache(sender, **kwargs)
+
+
+def invalidate_viewer_state(user_ids):
+    for user_id in set(user_ids):
+        key = recipe_cache.viewer_key(user_id)
+        recipe_cache.invalidate(key)
+        transaction.on_commit(partial(recipe_cache.invalidate, key))
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+def invalidate_viewer_state_on_favorite(sender, instance, **kwargs):
+    invalidate_viewer_state([instance.user_id])
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+def invalidate_viewer_state_on_subscribe(sender, instance, **kwargs):
+    invalidate_viewer_state([instance.subscriber_id])
+
+
+@receiver((post_save, post_delete), sender=ShoppingCartRecipe)
+def invalidate_viewer_state_on_cart_recipe(sender, instance, **kwargs):
+    invalidate_viewer_state(ShoppingCart.objects.filter(
+        pk=instance.shoppingcart_id
+    ).values_list('user', flat=True))
+
+
+@receiver(m2m_changed, sender=ShoppingCart.recipes.through)
+def invalidate_viewer_state_on_cart_change(sender, instance, action,
+                                           reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_viewer_state([instance.user_id])
+        return
+    carts = ShoppingCart.objects.filter(recipes=instance)
+    if pk_set is not None:
+        carts = ShoppingCart.objects.filter(pk__in=pk_set)
+    invalidate_viewer_state(carts.values_list('user', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_token_cache_on_user_change(sender, instance, created,
+                                          update_fields=None, **kwargs):
+    if created or update_fields is not None and set(update_fields) <= {
+        'last_login'
+    }:
+        return
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(connection_created)
+def count_connection_opened(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS_OPENED.labels(connection.alias).inc()
+
+
+@receiver(request_started)
+def count_connections_reused(sender, **kwargs):
+    '''
+    Считает соединения, пережившие прошлый запрос. Django закрывает
+    устаревшие и сломанные соединения раньше, в close_old_connections.
+    '''
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            metrics.DB_CONNECTIONS_REUSED.labels(connection.alias).inc()
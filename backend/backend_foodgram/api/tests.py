@@ -1,10 +1,37 @@
+import json
+import tempfile
+from datetime import timedelta
 from http import HTTPStatus
-from io import TextIOWrapper
+from io import StringIO
+from pathlib import Path
 
-from recipes.models import Ingredient, Quantity, Recipe, ShoppingCart, Tag
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from recipes import search, shopping_list
+from recipes.counters import count_subquery
+from recipes.management.commands.upload import Command as UploadCommand
+from recipes.models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
+                            ShoppingCart, ShoppingCartRecipe, ShoppingListItem,
+                            Tag)
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase
-from users.models import CustomUser
+from users.models import CustomUser, Subscribe
+
+from . import metrics, recipe_cache
+from .authentication import TokenCache, token_cache
+from .db_routers import ReplicaRouter, check_shared_cache
+from .ingredient_index import ingredient_index
+from .management.commands.benchmark_api import Command as BenchmarkCommand
+from .management.commands.benchmark_pagination import \
+    Command as PaginationBenchmarkCommand
+from .middleware import ReplicaRoutingMiddleware
 
 KEYS = {
     'user': ('id', 'first_name', 'last_name', 'email', 'username',
@@ -17,6 +44,7 @@ KEYS = {
 }
 
 
+@override_settings(RECIPE_ETAGS=True, RECIPE_ANONYMOUS_CACHE=True)
 class APITest(APITestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -63,21 +91,28 @@ class APITest(APITestCase):
             recipe = Recipe(**data_for_create)
             bulk_recipe.append(recipe)
         Recipe.objects.bulk_create(bulk_recipe)
-        for i in Recipe.objects.all():
-            Quantity.objects.create(
-                recipe=i,
-                ingredient=Ingredient.objects.get(pk=i.pk),
-                amount=100
-            )
-            Quantity.objects.create(
-                recipe=i,
-                ingredient=Ingredient.objects.get(pk=i.pk + 1),
-                amount=150
-            )
-            ingredients = (Ingredient.objects.get(pk=i.pk).pk,
-                           Ingredient.objects.get(pk=i.pk + 1).pk)
-            i.ingredients.set(ingredients)
-            i.tags.set(Tag.objects.filter(pk=cls.tag.pk))
+        # bulk_create не отправляет сигналы, счётчик считается отдельно.
+        CustomUser.objects.update(
+            recipes_count=count_subquery(Recipe, 'author')
+        )
+        # Коммита в тестах нет, поэтому отложенные до него пересчёты
+        # (например, векторов поиска) выполняются сразу.
+        with cls.captureOnCommitCallbacks(execute=True):
+            for i in Recipe.objects.all():
+                Quantity.objects.create(
+                    recipe=i,
+                    ingredient=Ingredient.objects.get(pk=i.pk),
+                    amount=100
+                )
+                Quantity.objects.create(
+                    recipe=i,
+                    ingredient=Ingredient.objects.get(pk=i.pk + 1),
+                    amount=150
+                )
+                ingredients = (Ingredient.objects.get(pk=i.pk).pk,
+                               Ingredient.objects.get(pk=i.pk + 1).pk)
+                i.ingredients.set(ingredients)
+                i.tags.set(Tag.objects.filter(pk=cls.tag.pk))
 
     def setUp(self):
         self.auth_client = APIClient()
@@ -448,6 +483,95 @@ class APITest(APITestCase):
                 self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
                 self.assertEqual(Recipe.objects.count(), 0)
 
+    def test_recipe_quantity_writes(self):
+        '''
+        Ингредиенты рецепта записываются пачками, а при изменении
+        рецепта меняются только отличающиеся записи.
+        '''
+        data = {
+            'ingredients': [{'id': pk, 'amount': 10} for pk in range(1, 31)],
+            'tags': [1],
+            'name': 'Big recipe',
+            'text': 'text',
+            'cooking_time': 15,
+            'image': ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEA'
+                      'AAABAgMAAABieywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACX'
+                      'BIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOy'
+                      'YQAAAABJRU5ErkJggg=='),
+        }
+
+        def quantity_writes(context):
+            return [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].startswith((
+                    'INSERT INTO "recipes_quantity"',
+                    'UPDATE "recipes_quantity"',
+                    'DELETE FROM "recipes_quantity"'
+                ))
+            ]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.post(
+                '/api/recipes/', data=data, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(quantity_writes(context)), 1)
+        recipe = Recipe.objects.get(name='Big recipe')
+        self.auth_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        data['ingredients'] = (
+            [{'id': pk, 'amount': 10} for pk in range(1, 21)]
+            + [{'id': pk, 'amount': 20} for pk in range(21, 26)]
+            + [{'id': pk, 'amount': 5} for pk in range(31, 36)]
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.patch(
+                f'/api/recipes/{recipe.pk}/', data=data, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(quantity_writes(context)), 3)
+        # Удалённые ингредиенты не дают запросов по каждой строке.
+        self.assertEqual(len(context.captured_queries), 24)
+        self.assertEqual(len(response.data['ingredients']), 30)
+        self.assertEqual(
+            dict(recipe.quantity_set.values_list('ingredient', 'amount')),
+            {item['id']: item['amount'] for item in data['ingredients']}
+        )
+        self.assertEqual(shopping_list.verify(), {})
+
+    def test_recipe_validation_lookups(self):
+        data = {
+            'ingredients': [{'id': pk, 'amount': 10} for pk in range(1, 31)],
+            'tags': [1, 2],
+            'name': 'Checked recipe',
+            'text': 'text',
+            'cooking_time': 15,
+            'image': ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEA'
+                      'AAABAgMAAABieywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACX'
+                      'BIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOy'
+                      'YQAAAABJRU5ErkJggg=='),
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.post(
+                '/api/recipes/', data=data, format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        lookups = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "recipes_ingredient"' in query['sql']
+        ]
+        self.assertEqual(len(lookups), 1)
+        data['name'] = 'Missing ids'
+        data['ingredients'] += [{'id': 5000, 'amount': 1},
+                                {'id': 5001, 'amount': 1}]
+        data['tags'] = [1, 12]
+        response = self.auth_client.post(
+            '/api/recipes/', data=data, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertEqual(len(response.data['tags']), 1)
+
     def test_subscriptions(self):
         Recipe.objects.create(
             author=CustomUser.objects.get(username__endswith='name2'),
@@ -474,6 +598,53 @@ class APITest(APITestCase):
         )
         self.assertEqual(current_user.authors.count(), 5)
 
+    def test_subscriptions_recipes_limit(self):
+        author = CustomUser.objects.get(username='username2')
+        for i in range(3):
+            Recipe.objects.create(author=author, name=f'Extra{i}',
+                                  text='text', cooking_time=1)
+        for username in ('username2', 'username3', 'username4'):
+            user = CustomUser.objects.get(username=username)
+            self.auth_client.post(f'/api/users/{user.pk}/subscribe/')
+        latest = list(author.recipes.values_list('pk', flat=True)[:2])
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(
+                '/api/users/subscriptions/?recipes_limit=2'
+            )
+        recipe_queries = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "recipes_recipe"' in query['sql']
+        ]
+        self.assertEqual(len(recipe_queries), 1)
+        for result in response.data['results']:
+            with self.subTest(author=result['username']):
+                self.assertLessEqual(len(result['recipes']), 2)
+                if result['id'] == author.pk:
+                    self.assertEqual(
+                        [recipe['id'] for recipe in result['recipes']],
+                        latest
+                    )
+        response = self.auth_client.get(
+            '/api/users/subscriptions/?recipes_limit=abc'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_subscriptions_recipes_count(self):
+        author = CustomUser.objects.create(
+            username='chef', email='chef@fake.fake', first_name='Chef',
+            last_name='Chef'
+        )
+        for i in range(3):
+            Recipe.objects.create(author=author, name=f'Chef recipe{i}',
+                                  text='text', cooking_time=1)
+        Recipe.objects.filter(name='Chef recipe0').delete()
+        response = self.auth_client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.data['recipes_count'], 2)
+        response = self.auth_client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['recipes_count'], 2)
+
     def test_me(self):
         response = self.auth_client.get('/api/users/me/')
         self.check_keys(response.data.keys(), KEYS['user'])
@@ -512,6 +683,215 @@ class APITest(APITestCase):
         )
         print(response)
 
+    def test_recipes_filter_without_distinct(self):
+        tags = Tag.objects.exclude(pk=self.tag.pk)
+        for recipe in Recipe.objects.filter(pk__lte=6):
+            recipe.tags.add(*tags)
+        for pk in (2, 3, 4, 9):
+            self.auth_client.post(f'/api/recipes/{pk}/favorite/')
+        for pk in (3, 4, 10):
+            self.auth_client.post(f'/api/recipes/{pk}/shopping_cart/')
+        user = CustomUser.objects.get(username='pirat')
+        joined = (
+            Recipe.objects
+            .filter(tags__slug__in=('slug_1', 'slug_2'), users__user=user)
+            .exclude(shopping_carts__user=user)
+            .distinct()
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(
+                '/api/recipes/?tags=slug_1&tags=slug_2&is_favorited=1'
+                '&is_in_shopping_cart=0'
+            )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            list(joined.values_list('pk', flat=True))
+        )
+        self.assertEqual(response.data['count'], 1)
+        for query in context.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('DISTINCT', query['sql'].upper())
+        response = self.client.get('/api/recipes/?is_favorited=1')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_recipes_viewer_state(self):
+        self.auth_client.post('/api/recipes/5/favorite/')
+        self.auth_client.post('/api/recipes/7/shopping_cart/')
+        self.auth_client.post('/api/users/6/subscribe/')
+        response = self.auth_client.get('/api/recipes/?limit=20')
+        for result in response.data['results']:
+            with self.subTest(result=result['id']):
+                self.assertEqual(result['is_favorited'], result['id'] == 5)
+                self.assertEqual(result['is_in_shopping_cart'],
+                                 result['id'] == 7)
+                self.assertEqual(result['author']['is_subscribed'],
+                                 result['author']['id'] == 6)
+        response = self.auth_client.get('/api/recipes/5/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertFalse(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    def test_recipes_cursor_pagination(self):
+        # Половина рецептов с одинаковой датой: порядок решает id.
+        Recipe.objects.filter(pk__lte=10).update(
+            pub_date=Recipe.objects.get(pk=10).pub_date
+        )
+        response = self.client.get('/api/recipes/?cursor=&limit=4')
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        pages = [[recipe['id'] for recipe in response.data['results']]]
+        ids = list(pages[0])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            ids += pages[-1]
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.order_by('-pub_date', '-id')
+                 .values_list('pk', flat=True))
+        )
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            pages.pop()
+            self.assertEqual(
+                [recipe['id'] for recipe in response.data['results']],
+                pages[-1]
+            )
+        self.assertEqual(len(pages), 1)
+        response = self.client.get('/api/recipes/?cursor=cD1nYXJiYWdl')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get('/api/recipes/?limit=5')
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        # Курсор для замера указывает на ту же страницу, что и page.
+        cursor = PaginationBenchmarkCommand().cursor_for_offset(8)
+        response = self.client.get('/api/recipes/',
+                                   {'cursor': cursor, 'limit': 4})
+        self.assertEqual(
+            response.data['results'],
+            self.client.get('/api/recipes/?page=3&limit=4').data['results']
+        )
+
+    def test_recipes_conditional_get(self):
+        recipe = Recipe.objects.get(pk=5)
+        for address in ('/api/recipes/', f'/api/recipes/{recipe.pk}/'):
+            with self.subTest(address=address):
+                response = self.auth_client.get(address)
+                etag = response['ETag']
+                with self.assertNumQueries(0):
+                    response = self.auth_client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                for change in (f'/api/recipes/{recipe.pk}/favorite/',
+                               f'/api/recipes/{recipe.pk}/shopping_cart/',
+                               f'/api/users/{recipe.author_id}/subscribe/'):
+                    self.auth_client.post(change)
+                    response = self.auth_client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+                    etag = response['ETag']
+                quantity = recipe.quantity_set.first()
+                quantity.amount += 1
+                quantity.save()
+                response = self.auth_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                etag = response['ETag']
+                self.tag.save()
+                response = self.auth_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                for change in (f'/api/recipes/{recipe.pk}/favorite/',
+                               f'/api/recipes/{recipe.pk}/shopping_cart/',
+                               f'/api/users/{recipe.author_id}/subscribe/'):
+                    self.auth_client.delete(change)
+        # С кешем в памяти процесса другие воркеры не видят смены
+        # поколений, поэтому ETag без общего кеша не включаются.
+        with self.assertRaisesMessage(ImproperlyConfigured, 'RECIPE_ETAGS'):
+            check_shared_cache()
+        with override_settings(RECIPE_ETAGS=False):
+            response = self.auth_client.get('/api/recipes/')
+            self.assertNotIn('ETag', response)
+            self.client.get('/api/recipes/')
+            response = self.client.get('/api/recipes/')
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertNotIn('ETag', response)
+
+    def test_recipes_anonymous_cache(self):
+        recipe = Recipe.objects.get(pk=5)
+        recipe_cache.invalidate()
+        for address in ('/api/recipes/?limit=3&page=2',
+                        f'/api/recipes/{recipe.pk}/'):
+            with self.subTest(address=address):
+                stats = recipe_cache.stats()
+                response = self.client.get(address)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                with self.assertNumQueries(0):
+                    cached = self.client.get(address)
+                self.assertEqual(cached['X-Cache'], 'HIT')
+                self.assertEqual(cached.data, response.data)
+                self.assertEqual(cached['ETag'], response['ETag'])
+                self.assertEqual(recipe_cache.stats(), {
+                    'hits': stats['hits'] + 1,
+                    'misses': stats['misses'] + 1,
+                })
+                recipe.text = f'New text for {address}'
+                recipe.save()
+                response = self.client.get(address)
+                self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.auth_client.get('/api/recipes/')
+        self.assertNotIn('X-Cache', response)
+        self.client.get('/api/recipes/?limit=20')
+        for address in ('/api/recipes/?limit=020', '/api/recipes/?limit=999',
+                        '/api/recipes/?page=1&limit=20'):
+            with self.subTest(address=address):
+                self.assertEqual(self.client.get(address)['X-Cache'], 'HIT')
+        for address in ('/api/recipes/?page=abc', '/api/recipes/?page=999',
+                        '/api/recipes/?cursor=cD1nYXJiYWdl'):
+            with self.subTest(address=address):
+                stats = recipe_cache.stats()
+                for _ in range(2):
+                    response = self.client.get(address)
+                    self.assertEqual(response.status_code,
+                                     HTTPStatus.NOT_FOUND)
+                self.assertEqual(recipe_cache.stats()['hits'], stats['hits'])
+        with self.assertRaisesMessage(ImproperlyConfigured,
+                                      'RECIPE_ANONYMOUS_CACHE'):
+            check_shared_cache()
+        with override_settings(RECIPE_ANONYMOUS_CACHE=False):
+            self.assertNotIn('X-Cache', self.client.get('/api/recipes/'))
+
+    def test_recipes_query_budget(self):
+        '''
+        Количество запросов к базе не зависит от размера страницы.
+        '''
+        author = CustomUser.objects.get(username='username1')
+        for i in range(4):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Budget{i}', text='text',
+                cooking_time=5
+            )
+            recipe.tags.set(Tag.objects.all())
+            Quantity.objects.bulk_create(
+                Quantity(recipe=recipe, ingredient=ingredient, amount=10)
+                for ingredient in Ingredient.objects.all()[:3]
+            )
+        self.auth_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.auth_client.post(f'/api/users/{author.pk}/subscribe/')
+        for client in (self.client, self.auth_client):
+            queries = []
+            for limit in (6, 20):
+                with CaptureQueriesContext(connection) as context:
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+                queries.append(len(context))
+            with self.subTest(client=client):
+                self.assertEqual(queries[0], queries[1])
+
     def test_shopping_cart(self):
         # add to shopping_cart
         response = self.auth_client.post('/api/recipes/1/shopping_cart/')
@@ -522,11 +902,83 @@ class APITest(APITestCase):
         self.assertEqual(current_user.shoppingcart.recipes.count(), 2)
         # download shopping_cart
         response = self.auth_client.get('/api/recipes/download_shopping_cart/')
-        self.assertIsInstance(response.data, TextIOWrapper)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['kakaxa: 100 kg', 'ingredient1: 250 kg',
+                                 'ingredient2: 150 kg'])
+        response = self.auth_client.get(
+            '/api/recipes/download_shopping_cart/?format=csv'
+        )
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename=shoppinglist.csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,amount,measurement_unit')
+        self.assertEqual(len(lines), 4)
+        response = self.auth_client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        items = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([item['amount'] for item in items], [100, 250, 150])
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=txt'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
         # remove record from shopping_cart
         response = self.auth_client.delete('/api/recipes/1/shopping_cart/')
         self.assertEqual(current_user.shoppingcart.recipes.count(), 1)
 
+    def test_shopping_list_aggregate(self):
+        user = CustomUser.objects.get(username='pirat')
+        self.auth_client.post('/api/recipes/1/shopping_cart/')
+        self.auth_client.post('/api/recipes/2/shopping_cart/')
+        self.assertEqual(
+            dict(user.shopping_list.values_list('ingredient', 'amount')),
+            {1: 100, 2: 250, 3: 150}
+        )
+        other, _ = ShoppingCart.objects.get_or_create(user_id=1)
+        other.recipes.add(1, 2)
+        self.assertEqual(
+            shopping_list.calculate([user.pk]),
+            {(user.pk, 1): 100, (user.pk, 2): 250, (user.pk, 3): 150}
+        )
+        self.assertEqual(shopping_list.verify([user.pk]), {})
+        quantity = Quantity.objects.get(recipe=2, ingredient=2)
+        quantity.amount = 50
+        quantity.save()
+        Quantity.objects.filter(recipe=2, ingredient=3).delete()
+        self.assertEqual(
+            dict(user.shopping_list.values_list('ingredient', 'amount')),
+            {1: 100, 2: 200}
+        )
+        self.auth_client.delete('/api/recipes/1/shopping_cart/')
+        self.assertEqual(
+            dict(user.shopping_list.values_list('ingredient', 'amount')),
+            {2: 50}
+        )
+        other.recipes.add(3)
+        user.shoppingcart.recipes.add(3)
+        Quantity.objects.bulk_create(
+            Quantity(recipe_id=3, ingredient_id=pk, amount=1)
+            for pk in range(10, 20)
+        )
+        queries = []
+        for pk in (2, 3):
+            with CaptureQueriesContext(connection) as context:
+                Recipe.objects.filter(pk=pk).delete()
+            queries.append(len(context.captured_queries))
+        # Число запросов не зависит от количества ингредиентов рецепта.
+        self.assertEqual(queries[0], queries[1])
+        self.assertFalse(user.shopping_list.exists())
+        self.assertEqual(shopping_list.verify(), {})
+        ShoppingListItem.objects.create(user=user, ingredient_id=5, amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--verify',
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(shopping_list.verify(), {})
+
     def test_in_out_favorite(self):
         response = self.auth_client.post('/api/recipes/5/favorite/')
         token = response.request['HTTP_AUTHORIZATION'].split()[1]
@@ -535,8 +987,400 @@ class APITest(APITestCase):
         response = self.auth_client.delete('/api/recipes/5/favorite/')
         self.assertEqual(current_user.favorite_recipes.count(), 0)
 
+    def test_favorites_count(self):
+        other_client = APIClient()
+        other_client.force_authenticate(CustomUser.objects.get(pk=2))
+        for client in (self.auth_client, other_client):
+            client.post('/api/recipes/7/favorite/')
+        self.auth_client.post('/api/recipes/7/favorite/')
+        self.auth_client.post('/api/recipes/9/favorite/')
+        self.assertEqual(Recipe.objects.get(pk=7).favorites_count, 2)
+        response = self.auth_client.get('/api/recipes/?ordering=popular')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results'][:2]], [7, 9]
+        )
+        self.assertNotIn('favorites_count', response.data['results'][0])
+        response = self.auth_client.get(
+            '/api/recipes/?ordering=popular&cursor='
+        )
+        self.assertEqual(response.data['results'][0]['id'], 7)
+        response = self.auth_client.get('/api/recipes/?ordering=name')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.auth_client.delete('/api/recipes/7/favorite/')
+        self.auth_client.delete('/api/recipes/7/favorite/')
+        self.assertEqual(Recipe.objects.get(pk=7).favorites_count, 1)
+        Recipe.objects.filter(pk=9).update(favorites_count=5)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('favorites_count 5, expected 1', out.getvalue())
+        self.assertEqual(Recipe.objects.get(pk=9).favorites_count, 1)
+        self.assertEqual(CustomUser.objects.get(pk=2).recipes_count, 1)
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('Found 0 counters', out.getvalue())
+
+    def test_trending(self):
+        other_client = APIClient()
+        other_client.force_authenticate(CustomUser.objects.get(pk=2))
+        other_client.post('/api/recipes/4/favorite/')
+        other_client.post('/api/recipes/6/favorite/')
+        self.auth_client.post('/api/recipes/6/shopping_cart/')
+        self.auth_client.post('/api/recipes/8/favorite/')
+        FavoriteRecipe.objects.filter(recipe=8).update(
+            added_at=timezone.now() - timedelta(days=10)
+        )
+        response = self.client.get('/api/recipes/trending/')
+        self.assertEqual(response.data['results'], [])
+        out = StringIO()
+        call_command('compute_trending', stdout=out)
+        self.assertIn('Ranked 3 recipes', out.getvalue())
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/trending/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], [6, 4, 8]
+        )
+        call_command('compute_trending', '--window=5', stdout=out)
+        response = self.auth_client.get('/api/recipes/trending/?limit=1')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['id'], 6)
+        self.assertTrue(response.data['results'][0]['is_in_shopping_cart'])
+
+    def test_recipes_search(self):
+        cases = (('kakaxa', [1]), ('Recipe5', [4]), ('Text7', [6]),
+                 ('unknown', []))
+        for text, expected in cases:
+            with self.subTest(text=text):
+                response = self.auth_client.get(
+                    '/api/recipes/', {'search': text}
+                )
+                self.assertEqual(
+                    [recipe['id'] for recipe in response.data['results']],
+                    expected
+                )
+        self.auth_client.post('/api/recipes/4/favorite/')
+        response = self.auth_client.get(
+            '/api/recipes/?search=ingredient4&ordering=popular&limit=1'
+        )
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['id'], 4)
+
+    def test_recipes_search_postgres(self):
+        if not search.is_supported():
+            self.skipTest('Полнотекстовый поиск есть только в PostgreSQL')
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(
+                '/api/recipes/', {'search': 'Recipe7 or ingredient6'}
+            )
+        # Совпадение в названии весит больше, чем в ингредиентах.
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], [6, 7]
+        )
+        self.assertTrue(any(
+            '@@' in query['sql'] for query in context.captured_queries
+        ))
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Recipe._meta.db_table
+            )
+        self.assertEqual(constraints['recipe_search_vector_idx']['type'],
+                         'gin')
+
+    def test_search_vector_updates(self):
+        '''
+        Вектор рецепта пересчитывается одним запросом после коммита,
+        а при удалении рецепта не пересчитывается вовсе.
+        '''
+        if not search.is_supported():
+            self.skipTest('Полнотекстовый поиск есть только в PostgreSQL')
+        data = {
+            'ingredients': [{'id': pk, 'amount': 10} for pk in range(2, 12)],
+            'tags': [1],
+            'name': 'Vector recipe',
+            'text': 'text',
+            'cooking_time': 15,
+            'image': ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEA'
+                      'AAABAgMAAABieywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACX'
+                      'BIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOy'
+                      'YQAAAABJRU5ErkJggg=='),
+        }
+
+        def request(method, address, **kwargs):
+            with CaptureQueriesContext(connection) as context:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = getattr(self.auth_client, method)(
+                        address, format='json', **kwargs
+                    )
+            return response, len([
+                query for query in context.captured_queries
+                if query['sql'].startswith('UPDATE "recipes_recipe" '
+                                           'SET "search_vector"')
+            ])
+
+        response, updates = request('post', '/api/recipes/', data=data)
+        self.assertEqual(updates, 1)
+        recipe_id = response.data['id']
+        data['ingredients'] = [{'id': 1, 'amount': 5}]
+        response, updates = request('patch', f'/api/recipes/{recipe_id}/',
+                                    data=data)
+        self.assertEqual(updates, 1)
+        self.assertEqual(
+            search.search(Recipe.objects.all(), 'kakaxa').filter(
+                pk=recipe_id
+            ).count(), 1
+        )
+        response, updates = request('delete', f'/api/recipes/{recipe_id}/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(updates, 0)
+
     def test_filter_ingredients(self):
-        ...
+        ingredient_index.invalidate()
+        response = self.client.get('/api/ingredients/?name=INGREDIENT1')
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            list(Ingredient.objects.filter(name__istartswith='ingredient1')
+                 .order_by('name').values_list('name', flat=True))
+        )
+        self.check_keys(response.data[0].keys(), ('id', 'name', 'measure'))
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=kak')
+        self.assertEqual(response.data[0]['id'], self.ingredient.pk)
+        Ingredient.objects.create(name='ingredient100', measure='g')
+        response = self.client.get('/api/ingredients/?name=ingredient10')
+        self.assertIn('ingredient100',
+                      [ingredient['name'] for ingredient in response.data])
+        Ingredient.objects.filter(name='ingredient100').delete()
+        response = self.client.get('/api/ingredients/?name=ingredient10')
+        self.assertNotIn('ingredient100',
+                         [ingredient['name'] for ingredient in response.data])
+        address = f'/api/ingredients/{self.ingredient.pk}/'
+        response = self.client.get(address, {'name': 'KAK'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['id'], self.ingredient.pk)
+        response = self.client.get(address, {'name': 'ingredient'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_cached_catalogs(self):
+        for address, model, data in (
+            ('/api/tags/', Tag,
+             {'name': 'new_tag', 'color': '#ff0000', 'slug': 'new_tag'}),
+            ('/api/ingredients/', Ingredient,
+             {'name': 'new_ingredient', 'measure': 'g'}),
+        ):
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertEqual(len(response.json()), model.objects.count())
+                self.assertIn('max-age', response['Cache-Control'])
+                etag = response['ETag']
+                with self.assertNumQueries(0):
+                    cached = self.client.get(address)
+                self.assertEqual(cached.content, response.content)
+                response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                model.objects.create(**data)
+                response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(len(response.json()), model.objects.count())
+
+    def test_metrics(self):
+        self.auth_client.post('/api/recipes/3/shopping_cart/')
+        self.auth_client.get('/api/recipes/')
+        response = self.auth_client.get(
+            '/api/recipes/download_shopping_cart/?format=csv'
+        )
+        b''.join(response.streaming_content)
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        content = response.content.decode()
+        for method, status, view in (
+            ('GET', 200, 'api:recipes-list'),
+            ('GET', 200, 'api:recipes-download-shopping-cart'),
+            ('POST', 201, 'api:recipes-shopping-cart'),
+        ):
+            with self.subTest(view=view):
+                self.assertIn(
+                    'foodgram_request_duration_seconds_count{'
+                    f'method="{method}",status="{status}",view="{view}"}}',
+                    content
+                )
+        self.assertIn(
+            'foodgram_request_db_queries_bucket{le="0.0",method="GET",'
+            'view="api:recipes-download-shopping-cart"} 0.0',
+            content
+        )
+
+    def test_seed_load(self):
+        self.client.get('/api/tags/')
+        out = StringIO()
+        call_command('seed_load', '--users=5', '--recipes=20', '--tags=2',
+                     '--favorites=3', '--cart=2', '--subscriptions=2',
+                     stdout=out)
+        users = CustomUser.objects.filter(username__startswith='load')
+        self.assertEqual(users.count(), 5)
+        self.assertEqual(
+            Recipe.objects.filter(name__startswith='load recipe').count(), 20
+        )
+        self.assertEqual(ShoppingCart.objects.filter(user__in=users).count(),
+                         5)
+        self.assertEqual(shopping_list.verify(), {})
+        self.assertEqual(
+            sum(users.values_list('recipes_count', flat=True)), 20
+        )
+        self.assertEqual(
+            sum(Recipe.objects.values_list('favorites_count', flat=True)), 15
+        )
+        self.assertEqual(len(self.client.get('/api/tags/').json()),
+                         Tag.objects.count())
+        if search.is_supported():
+            self.assertFalse(Recipe.objects.filter(
+                name__startswith='load recipe', search_vector__isnull=True
+            ).exists())
+        with self.assertRaises(CommandError):
+            call_command('seed_load', '--users=1', stdout=out)
+
+    def test_benchmark_api(self):
+        self.auth_client.post('/api/recipes/3/shopping_cart/')
+        for author in (2, 3):
+            self.auth_client.post(f'/api/users/{author}/subscribe/')
+        Subscribe.objects.create(subscriber_id=4, author_id=5)
+        self.assertEqual(BenchmarkCommand().get_user(None).username, 'pirat')
+        with tempfile.TemporaryDirectory() as directory:
+            report = Path(directory) / 'report.json'
+            call_command('benchmark_api', '--repeat=1', '--user=pirat',
+                         f'--output={report}', stdout=StringIO())
+            endpoints = json.loads(report.read_text())['endpoints']
+            self.assertIn('recipes tags author is_favorited '
+                          'is_in_shopping_cart', endpoints)
+            self.assertIn('subscriptions recipes_limit=3', endpoints)
+            for name, result in endpoints.items():
+                with self.subTest(name=name):
+                    self.assertEqual(result['status'], HTTPStatus.OK)
+                    self.assertLessEqual(result['p50'], result['max'])
+            endpoints['recipes']['queries'] -= 1
+            previous = Path(directory) / 'previous.json'
+            previous.write_text(json.dumps({'endpoints': endpoints}))
+            with self.assertRaisesMessage(CommandError, 'recipes'):
+                call_command('benchmark_api', '--repeat=1', '--user=pirat',
+                             f'--output={report}', f'--compare={previous}',
+                             stdout=StringIO())
+
+    def test_upload_ingredients(self):
+        self.client.get('/api/ingredients/')
+        self.client.get('/api/ingredients/', {'name': 'sa'})
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = Path(directory) / 'ingredients.csv'
+            csv_path.write_text('salt,g\nsugar,g\nkakaxa,kg\n',
+                                encoding='utf8')
+            json_path = Path(directory) / 'ingredients.json'
+            json_path.write_text(json.dumps([
+                {'name': 'salt', 'measurement_unit': 'g'},
+                {'name': 'pepper', 'measurement_unit': 'g'},
+            ]), encoding='utf8')
+            for path, expected in (
+                (csv_path, 'Inserted: 2, skipped: 1'),
+                (csv_path, 'Inserted: 0, skipped: 3'),
+                (json_path, 'Inserted: 1, skipped: 1'),
+            ):
+                with self.subTest(path=path.name, expected=expected):
+                    out = StringIO()
+                    call_command('upload', str(path), stdout=out)
+                    self.assertIn(expected, out.getvalue())
+            with open(json_path, encoding='utf8') as file:
+                self.assertEqual(
+                    [ingredient.name for ingredient in
+                     UploadCommand().read_json(file, chunk_size=7)],
+                    ['salt', 'pepper']
+                )
+            json_path.write_text('[{"name": "salt", "measure', 'utf8')
+            with self.assertRaises(CommandError):
+                call_command('upload', str(json_path), stdout=StringIO())
+        self.assertEqual(
+            Ingredient.objects.filter(
+                name__in=('salt', 'sugar', 'pepper')
+            ).count(), 3
+        )
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual(len(response.json()), Ingredient.objects.count())
+        response = self.client.get('/api/ingredients/', {'name': 'sa'})
+        self.assertIn('salt', [item['name'] for item in response.json()])
+
+    def test_cached_token_authentication(self):
+        token_cache.clear()
+        self.auth_client.get('/api/users/me/')
+        with self.assertNumQueries(0):
+            response = self.auth_client.get('/api/tags/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertGreater(token_cache.stats()['hit_rate'], 0)
+        user = CustomUser.objects.get(username='pirat')
+        user.is_active = False
+        user.save()
+        response = self.auth_client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        user.is_active = True
+        user.save()
+        self.auth_client.get('/api/users/me/')
+        self.auth_client.post('/api/auth/token/logout/')
+        response = self.auth_client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        # Воркеры с общим кешем сразу видят сброс токена в другом воркере.
+        token = Token.objects.create(user=user)
+        worker, other_worker = (TokenCache(10, 30, shared=True)
+                                for _ in range(2))
+        worker.set(token.key, token)
+        self.assertEqual(other_worker.get(token.key).user_id, user.pk)
+        worker.invalidate_user(user.pk)
+        self.assertIsNone(other_worker.get(token.key))
+        with override_settings(AUTH_TOKEN_CACHE_SHARED=True):
+            with self.assertRaisesMessage(ImproperlyConfigured,
+                                          'AUTH_TOKEN_CACHE_SHARED'):
+                check_shared_cache()
+
+    @override_settings(DATABASE_REPLICAS=['replica0'], RECIPE_ETAGS=False,
+                       RECIPE_ANONYMOUS_CACHE=False)
+    def test_replica_routing(self):
+        router = ReplicaRouter()
+        factory = RequestFactory(HTTP_AUTHORIZATION='Token abc')
+
+        def read_alias(request):
+            return HttpResponse(router.db_for_read(Recipe))
+
+        def write_then_read_alias(request):
+            router.db_for_write(Recipe)
+            return read_alias(request)
+
+        middleware = ReplicaRoutingMiddleware(read_alias)
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+        self.assertEqual(
+            middleware(factory.get('/api/recipes/')).content, b'replica0'
+        )
+        self.assertEqual(
+            ReplicaRoutingMiddleware(write_then_read_alias)(
+                RequestFactory().get('/api/recipes/')
+            ).content,
+            b'default'
+        )
+        self.assertEqual(
+            middleware(RequestFactory().get('/api/recipes/')).content,
+            b'replica0'
+        )
+        middleware(factory.post('/api/recipes/1/favorite/'))
+        self.assertEqual(
+            middleware(factory.get('/api/recipes/')).content, b'default'
+        )
+        self.assertEqual(
+            middleware(RequestFactory().get('/api/recipes/')).content,
+            b'replica0'
+        )
+        self.assertFalse(router.allow_migrate('replica0', 'recipes'))
+        with self.assertRaisesMessage(ImproperlyConfigured, 'DB_REPLICAS'):
+            check_shared_cache()
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            }}):
+                check_shared_cache()
 
     def test_logout(self):
         self.auth_client.post('/api/auth/token/logout/')
@@ -551,3 +1395,94 @@ class APITest(APITestCase):
         self.auth_client.post('/api/users/set_password/', data=data)
         new_password = CustomUser.objects.get(username='pirat').password
         self.assertFalse(current_password == new_password)
+
+
+class DBConnectionTest(TransactionTestCase):
+    '''
+    Жизненный цикл соединения между запросами. Тестовый клиент не
+    закрывает соединения, поэтому запросы идут напрямую в WSGIHandler.
+    '''
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не закрывает соединение')
+
+    def request(self, path):
+        response = WSGIHandler()(RequestFactory().get(path).environ,
+                                 lambda status, headers: None)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response.close()
+
+    def count(self, name):
+        return metrics.REGISTRY.get_sample_value(
+            f'foodgram_db_connections_{name}_total', {'alias': 'default'}
+        ) or 0
+
+    def test_connection_reuse(self):
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        self.addCleanup(connection.settings_dict.__setitem__,
+                        'CONN_MAX_AGE', max_age)
+        for max_age, opened, reused in ((0, 2, 0), (60, 1, 1)):
+            with self.subTest(max_age=max_age):
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                before = self.count('opened'), self.count('reused')
+                # Фильтр по избранному не кешируется и всегда идёт в базу.
+                for _ in range(2):
+                    self.request('/api/recipes/?is_favorited=0')
+                self.assertEqual(
+                    (self.count('opened') - before[0],
+                     self.count('reused') - before[1]),
+                    (opened, reused)
+                )
+
+
+class MigrationTest(TransactionTestCase):
+    '''
+    Миграции заполняют новые таблицы и счётчики по данным,
+    которые уже были в базе до них.
+    '''
+    initial = [('recipes', '0001_initial'), ('users', '0001_initial')]
+
+    def migrate(self, targets=None):
+        executor = MigrationExecutor(connection)
+        if targets is None:
+            targets = executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_backfill(self):
+        self.addCleanup(self.migrate)
+        apps = self.migrate(self.initial)
+        user = apps.get_model('users', 'CustomUser').objects.create(
+            username='old', email='old@fake.fake'
+        )
+        ingredient = apps.get_model('recipes', 'Ingredient').objects.create(
+            name='old ingredient', measure='g'
+        )
+        recipe = apps.get_model('recipes', 'Recipe').objects.create(
+            author=user, name='Old recipe', text='text', cooking_time=1
+        )
+        apps.get_model('recipes', 'Quantity').objects.create(
+            recipe=recipe, ingredient=ingredient, amount=5
+        )
+        apps.get_model('recipes', 'ShoppingCart').objects.create(
+            user=user
+        ).recipes.add(recipe)
+        apps.get_model('recipes', 'FavoriteRecipe').objects.create(
+            user=user, recipe=recipe
+        )
+        self.migrate()
+        self.assertEqual(shopping_list.stored([user.pk]),
+                         {(user.pk, ingredient.pk): 5})
+        self.assertEqual(CustomUser.objects.get(pk=user.pk).recipes_count, 1)
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertIsNotNone(
+            ShoppingCartRecipe.objects.get(recipe=recipe).added_at
+        )
+        self.assertIsNotNone(
+            FavoriteRecipe.objects.get(recipe=recipe).added_at
+        )
+        if search.is_supported():
+            self.assertIsNotNone(recipe.search_vector)
@@ -18,9 +18,11 @@ router_only_get.register(r'tags', views.TagViewSet, basename='tags')
 router_v1.register(r'users', views.CustomUserViewSet)
 
 urlpatterns = [
+    path('metrics', views.export_metrics, name='metrics'),
     re_path(
         r'^users/subscriptions/',
         views.SubscriptionViewSet.as_view({'get': 'list'}),
+        name='subscriptions'
     ),
     path('', include(router_v1.urls)),
     path('', include(router_only_get.urls)),
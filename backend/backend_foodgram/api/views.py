@@ -1,18 +1,28 @@
-from django.db.models import Count, F, Sum
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Subquery
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_list_or_404, get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from users.models import CustomUser
 
+from . import metrics
 from .custom_filters import (AuthorFilter, IngredientFilter, IsFavoritedFilter,
-                             IsInShoppingcartFilter, TagFilter)
-from .custom_pagination import PageLimitPagination
+                             IsInShoppingcartFilter, RecipeOrderingFilter,
+                             RecipeSearchFilter, TagFilter)
+from .custom_mixins import (AnonymousCacheMixin, CatalogCacheMixin,
+                            ConditionalGetMixin)
+from .custom_pagination import PageLimitPagination, RecipePagination
+from .custom_renderers import (CSVShoppingListRenderer,
+                               JSONShoppingListRenderer,
+                               TextShoppingListRenderer)
 from .permissions import IsOwnerOrAdminOrReadOnly
 from .serializers import (AnonimusRecipeSerializer, CustomUserCreateSerializer,
                           FavoritePostDeleteSerializer, IngredientSerializer,
@@ -23,6 +33,27 @@ from .serializers import (AnonimusRecipeSerializer, CustomUserCreateSerializer,
                           TagSerializer)
 
 
+def recipes_limit_prefetch(request):
+    '''
+    Prefetch рецептов автора для подписок. Параметр recipes_limit
+    применяется в базе: для каждого автора выбирается не больше
+    recipes_limit последних рецептов.
+    '''
+    recipes = Recipe.objects.all()
+    if 'recipes_limit' not in request.query_params:
+        return Prefetch('recipes', queryset=recipes)
+    try:
+        recipes_limit = int(request.query_params.get('recipes_limit'))
+    except ValueError:
+        raise ValidationError('recipes_limit должен быть целым числом')
+    if recipes_limit < 0:
+        raise ValidationError('recipes_limit не может быть отрицательным')
+    return Prefetch('recipes', queryset=recipes.filter(pk__in=Subquery(
+        Recipe.objects.filter(author=OuterRef('author'))
+        .values('pk')[:recipes_limit]
+    )))
+
+
 class CustomUserViewSet(UserViewSet):
 
     @action(
@@ -59,8 +90,8 @@ class CustomUserViewSet(UserViewSet):
         serializer.save()
         serializer = SubscriptionsSerializer(
             (
-                CustomUser.objects.annotate(recipes_count=Count('recipes'))
-                .order_by('username')
+                CustomUser.objects
+                .prefetch_related(recipes_limit_prefetch(request))
                 .get(pk=serializer.validated_data['author'].pk)
             ),
             context={'request': request},
@@ -74,30 +105,69 @@ class SubscriptionViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        authors = self.request.user.authors.all()
-        authors_pk = [author.author.pk for author in authors]
         return (
-            CustomUser.objects.filter(pk__in=authors_pk)
-            .annotate(recipes_count=Count('recipes')).order_by('username')
+            CustomUser.objects
+            .filter(subscribers__subscriber=self.request.user)
+            .order_by('username')
+            .prefetch_related(recipes_limit_prefetch(self.request))
         )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_name = 'ingredients'
     queryset = Ingredient.objects.all().order_by('name')
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (IngredientFilter,)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
-    pagination_class = PageLimitPagination
+class RecipeViewSet(AnonymousCacheMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
+    pagination_class = RecipePagination
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend, IsFavoritedFilter,
-                       IsInShoppingcartFilter, TagFilter)
+                       IsInShoppingcartFilter, TagFilter, RecipeOrderingFilter,
+                       RecipeSearchFilter)
     filterset_class = AuthorFilter
+    ordering = Recipe._meta.ordering
     http_method_names = ('get', 'post', 'patch', 'delete')
 
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'quantity_set',
+                queryset=Quantity.objects.select_related('ingredient')
+            ),
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                FavoriteRecipe.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.recipes.through.objects.filter(
+                    shoppingcart__user=user, recipe=OuterRef('pk')
+                )
+            ),
+        )
+
+    def get_list_version(self):
+        if RecipeOrderingFilter.ordering_param in self.request.query_params:
+            # Порядок зависит от счётчиков избранного, версии у него нет.
+            return None
+        return super().get_list_version()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['subscribed_authors'] = set(
+                self.request.user.authors.values_list('author', flat=True)
+            )
+        return context
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return RecipeCreateSerializer
@@ -141,7 +211,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk):
         if request.method == 'DELETE':
-            request.user.favorite_recipes.filter(recipe__pk=pk).delete()
+            with transaction.atomic():
+                deleted, _ = request.user.favorite_recipes.filter(
+                    recipe__pk=pk
+                ).delete()
+                if deleted:
+                    Recipe.objects.filter(
+                        pk=pk, favorites_count__gt=0
+                    ).update(favorites_count=F('favorites_count') - deleted)
             return Response('Подписка отменена',
                             status=status.HTTP_204_NO_CONTENT)
         request.data.clear()
@@ -156,26 +233,55 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.is_valid()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(detail=False, permission_classes=(IsAuthenticated,))
+    @action(detail=False)
+    def trending(self, request):
+        '''
+        Популярные рецепты из таблицы рейтинга, которую пересчитывает
+        команда compute_trending.
+        '''
+        queryset = self.get_queryset().filter(
+            ranking__isnull=False
+        ).order_by('-ranking__score', 'pk')
+        paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            renderer_classes=(TextShoppingListRenderer,
+                              CSVShoppingListRenderer,
+                              JSONShoppingListRenderer))
     def download_shopping_cart(self, request):
-        result = (Ingredient.objects.values('name')
-                  .filter(recipes__in=request.user.shoppingcart.recipes.all())
-                  .values('name', measure=F('measure'))
-                  .annotate(ingredient_sum=Sum('quantity__amount')))
-        shopping_list = []
-        for item in result:
-            shopping_list.append(
-                f'{item["name"]}: {item["ingredient_sum"]} '
-                f'{item["measure"]}\n')
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+        items = (
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .order_by('ingredient_id')
+            .values_list('ingredient', 'ingredient__name',
+                         'ingredient__measure', 'amount')
+            .iterator()
         )
-        filename = 'shoppinglist.txt'
+        rows = (
+            {'id': pk, 'name': name, 'amount': amount,
+             'measurement_unit': measure}
+            for pk, name, measure, amount in items
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        filename = f'shoppinglist.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_name = 'tags'
     queryset = Tag.objects.all().order_by('name')
     serializer_class = TagSerializer
     pagination_class = None
+
+
+def export_metrics(request):
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)
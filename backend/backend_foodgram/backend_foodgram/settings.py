@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,7 +86,39 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+    }
+}
+# Реплики для чтения: хосты PostgreSQL или файлы SQLite через запятую.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(','))
+):
+    field = 'NAME' if 'sqlite3' in DATABASES['default']['ENGINE'] else 'HOST'
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'], field: replica.strip(),
+        'TEST': {'MIRROR': 'default'}
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+# Пул соединений pgbouncer в режиме transaction: приложение подключается
+# к нему вместо основной базы, а серверные курсоры за ним не работают.
+if os.getenv('DB_POOLER_HOST'):
+    DATABASES['default'].update({
+        'HOST': os.getenv('DB_POOLER_HOST'),
+        'PORT': os.getenv('DB_POOLER_PORT', '6432'),
+        'DISABLE_SERVER_SIDE_CURSORS': True,
+    })
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter']
+DATABASE_PIN_SECONDS = int(os.getenv('DATABASE_PIN_SECONDS', 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -106,7 +140,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -154,6 +188,19 @@ MAX_LENGTH_HEX_COLOR = 7
 MAX_LENGTH_MEASURE = 20
 PAGE_SIZE_CUSTOM_PAGINATOR = 6
 MAX_PAGE_SIZE_CUSTOM_PAGINATOR = 20
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+RECIPE_ETAGS = os.getenv('RECIPE_ETAGS', '') == 'True'
+RECIPE_ANONYMOUS_CACHE = os.getenv('RECIPE_ANONYMOUS_CACHE', '') == 'True'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 86400))
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 86400))
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', 30))
+TRENDING_HALF_LIFE_DAYS = float(os.getenv('TRENDING_HALF_LIFE_DAYS', 3))
+TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', 100))
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 30))
+AUTH_TOKEN_CACHE_SHARED = os.getenv('AUTH_TOKEN_CACHE_SHARED', '') == 'True'
 
 COLOR_CHOICES = (
     ('#ff0000', 'Red'),
@@ -1,9 +1,8 @@
 from django.contrib import admin
-from django.db.models import Sum
 
 from .forms import AtLeastOneFormSet
 from .models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
-                     ShoppingCart, Tag)
+                     RecipeRanking, ShoppingCart, ShoppingCartRecipe, Tag)
 
 
 class QuantityInLine(admin.TabularInline):
@@ -12,6 +11,12 @@ class QuantityInLine(admin.TabularInline):
     formset = AtLeastOneFormSet
 
 
+class ShoppingCartRecipeInLine(admin.TabularInline):
+    model = ShoppingCartRecipe
+    extra = 1
+    readonly_fields = ('added_at',)
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('author', 'name')
@@ -28,7 +33,7 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ('favorite_count',)
 
     def favorite_count(self, obj):
-        return obj.users.count()
+        return obj.favorites_count
 
     favorite_count.short_description = 'Количество добавлений в избранное'
 
@@ -44,19 +49,30 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {
             "fields": (
-                'user', 'recipes', 'shopping_cart'
+                'user', 'shopping_cart'
             ),
         }),
     )
     readonly_fields = ('shopping_cart',)
+    inlines = (ShoppingCartRecipeInLine,)
+
+    def save_formset(self, request, form, formset, change):
+        '''
+        Сохраняет рецепты через recipes.set(), чтобы сработали сигналы,
+        пересчитывающие список покупок.
+        '''
+        form.instance.recipes.set(
+            inline_form.cleaned_data['recipe']
+            for inline_form in formset.forms
+            if inline_form.cleaned_data
+            and not inline_form.cleaned_data.get('DELETE')
+        )
 
     def shopping_cart(self, obj):
-        result = (Ingredient.objects.values('name')
-                  .filter(recipes__in=obj.user.shoppingcart.recipes.all())
-                  .annotate(ingredient_sum=Sum('quantity__amount')))
+        result = (obj.user.shopping_list.order_by('ingredient')
+                  .values_list('ingredient__name', 'amount'))
         list_of_ingredients = ''
-        for item in result:
-            key, value = item.values()
+        for key, value in result:
             row = f'{key}: {value}\n'
             list_of_ingredients += row
         return list_of_ingredients
@@ -65,3 +81,4 @@ class ShoppingCartAdmin(admin.ModelAdmin):
 admin.site.register(Tag)
 admin.site.register(FavoriteRecipe)
 admin.site.register(Quantity)
+admin.site.register(RecipeRanking)
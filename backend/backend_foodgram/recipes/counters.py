@@ -0,0 +1,13 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    '''
+    Количество строк model, у которых field указывает на текущую
+    строку внешнего запроса.
+    '''
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(count=Count('pk')).values('count')
+    ), Value(0))
@@ -0,0 +1,16 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models
+
+
+class SearchVectorIndex(GinIndex):
+    '''
+    GIN индекс по search_vector. На других базах создаётся обычным
+    индексом, чтобы миграции и пересборка таблиц в SQLite не падали.
+    '''
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor,
+                                           using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using,
+                                  **kwargs)
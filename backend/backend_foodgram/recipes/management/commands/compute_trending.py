@@ -0,0 +1,28 @@
+import time
+
+from django.core import management
+
+from ... import trending
+
+
+class Command(management.base.BaseCommand):
+    help = ('Recalculate the trending recipes ranking from favorites '
+            'and shopping cart additions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int,
+                            help='Number of days of activity to consider')
+        parser.add_argument('--half-life', type=float,
+                            help='Days after which an addition counts half')
+        parser.add_argument('--size', type=int,
+                            help='Number of recipes to keep in the ranking')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        ranked = trending.rebuild(window=options['window'],
+                                  half_life=options['half_life'],
+                                  size=options['size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {ranked} recipes in '
+            f'{time.perf_counter() - start:.2f} s'
+        ))
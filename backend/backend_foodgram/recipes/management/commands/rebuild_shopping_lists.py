@@ -0,0 +1,35 @@
+from django.core import management
+
+from ... import shopping_list
+
+
+class Command(management.base.BaseCommand):
+    help = 'Rebuild or verify aggregated shopping lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare the table with the shopping carts'
+        )
+        parser.add_argument('--user', type=int, action='append',
+                            dest='user_ids')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['verify']:
+            shopping_list.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS('Shopping lists rebuilt'))
+            return
+        mismatches = shopping_list.verify(user_ids)
+        for (user_id, ingredient_id), (actual, expected) in sorted(
+            mismatches.items()
+        ):
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'stored {actual}, expected {expected}'
+            )
+        if mismatches:
+            raise management.base.CommandError(
+                f'{len(mismatches)} mismatched shopping list items'
+            )
+        self.stdout.write(self.style.SUCCESS('Shopping lists are consistent'))
@@ -0,0 +1,46 @@
+from django.core import management
+from django.db import transaction
+from django.db.models import F
+from users.models import CustomUser
+
+from ...counters import count_subquery
+from ...models import FavoriteRecipe, Recipe
+
+
+class Command(management.base.BaseCommand):
+    help = 'Recalculate favorites_count of recipes and recipes_count of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report counters that differ from the actual values'
+        )
+
+    def reconcile(self, queryset, counter, actual):
+        drifted = queryset.annotate(actual=actual).exclude(
+            **{counter: F('actual')}
+        )
+        for pk, stored, expected in drifted.values_list(
+            'pk', counter, 'actual'
+        ):
+            self.stdout.write(
+                f'{queryset.model._meta.model_name} {pk}: '
+                f'{counter} {stored}, expected {expected}'
+            )
+        if self.dry_run:
+            return drifted.count()
+        return queryset.filter(pk__in=drifted.values('pk')).update(
+            **{counter: actual}
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        fixed = (
+            self.reconcile(Recipe.objects.all(), 'favorites_count',
+                           count_subquery(FavoriteRecipe, 'recipe'))
+            + self.reconcile(CustomUser.objects.all(), 'recipes_count',
+                             count_subquery(Recipe, 'author'))
+        )
+        verb = 'Found' if self.dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {fixed} counters'))
@@ -0,0 +1,170 @@
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core import management
+from django.db import transaction
+from users.models import CustomUser, Subscribe
+
+from ... import search, shopping_list
+from ...counters import count_subquery
+from ...models import (FavoriteRecipe, Ingredient, Quantity, Recipe,
+                       ShoppingCart, ShoppingCartRecipe, Tag)
+from ...signals import bulk_changed
+
+WORDS = ('варить', 'жарить', 'нарезать', 'смешать', 'добавить', 'посолить',
+         'поперчить', 'запекать', 'остудить', 'подавать', 'минут', 'огонь',
+         'кастрюля', 'сковорода', 'духовка', 'миска', 'тесто', 'соус')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(management.base.BaseCommand):
+    help = ('Generate users, recipes, tags, favorites, subscriptions and '
+            'shopping carts for load testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Favorites per user')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Recipes in the shopping cart per user')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Subscriptions per user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Prefix of generated usernames, recipe and tag names'
+        )
+        parser.add_argument(
+            '--ingredients', default='/app/data/ingredients.csv',
+            help='Ingredients file, uploaded if the table is empty'
+        )
+
+    def log(self, message):
+        self.stdout.write(
+            f'{message} ({time.perf_counter() - self.start:.1f} s)'
+        )
+
+    def bulk_create(self, model, objects):
+        created = []
+        for batch in batched(objects, self.batch_size):
+            created.extend(
+                obj.pk for obj in model.objects.bulk_create(batch)
+            )
+        return created
+
+    def create_users(self, count):
+        password = make_password('password')
+        users = self.bulk_create(CustomUser, (
+            CustomUser(username=f'{self.prefix}{i}',
+                       email=f'{self.prefix}{i}@fake.fake',
+                       first_name=f'Name{i}', last_name=f'Surname{i}',
+                       password=password)
+            for i in range(count)
+        ))
+        carts = dict(zip(users, self.bulk_create(ShoppingCart, (
+            ShoppingCart(user_id=pk) for pk in users
+        ))))
+        return users, carts
+
+    def create_recipes(self, count, users, ingredients, tags):
+        rng = self.rng
+        recipes = []
+        for batch in batched(range(count), self.batch_size):
+            created = Recipe.objects.bulk_create(
+                Recipe(author_id=rng.choice(users),
+                       name=f'{self.prefix} recipe {i}',
+                       text=' '.join(rng.choices(WORDS, k=30)),
+                       cooking_time=rng.randint(5, 180),
+                       image='recipes/images/load.png')
+                for i in batch
+            )
+            Quantity.objects.bulk_create(
+                Quantity(recipe_id=recipe.pk, ingredient_id=ingredient,
+                         amount=rng.choice((1, 2, 5, 10, 50, 100, 250, 500)))
+                for recipe in created
+                for ingredient in rng.sample(
+                    ingredients, max(2, min(20, round(rng.gauss(9, 3))))
+                )
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+                for recipe in created
+                for tag in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+            )
+            recipes.extend(recipe.pk for recipe in created)
+        return recipes
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.start = time.perf_counter()
+        self.rng = rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise management.base.CommandError(
+                f'Users with prefix "{prefix}" already exist, '
+                'use another --prefix'
+            )
+        if not Ingredient.objects.exists():
+            management.call_command('upload', options['ingredients'],
+                                    stdout=self.stdout)
+        ingredients = sorted(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredients:
+            raise management.base.CommandError('No ingredients to use')
+        tags = self.bulk_create(Tag, (
+            Tag(name=f'{prefix} tag {i}', slug=f'{prefix}-tag-{i}',
+                color=rng.choice(Tag._meta.get_field('color').choices)[0])
+            for i in range(max(1, options['tags']))
+        ))
+        users, carts = self.create_users(options['users'])
+        self.log(f'Users: {len(users)}, tags: {len(tags)}')
+        recipes = self.create_recipes(options['recipes'], users,
+                                      ingredients, tags)
+        self.log(f'Recipes: {len(recipes)}')
+        favorites = min(options['favorites'], len(recipes))
+        self.bulk_create(FavoriteRecipe, (
+            FavoriteRecipe(user_id=user, recipe_id=recipe)
+            for user in users for recipe in rng.sample(recipes, favorites)
+        ))
+        cart = min(options['cart'], len(recipes))
+        self.bulk_create(ShoppingCartRecipe, (
+            ShoppingCartRecipe(shoppingcart_id=carts[user], recipe_id=recipe)
+            for user in users for recipe in rng.sample(recipes, cart)
+        ))
+        subscriptions = min(options['subscriptions'], len(users) - 1)
+        self.bulk_create(Subscribe, (
+            Subscribe(subscriber_id=user, author_id=author)
+            for user in users
+            for author in rng.sample(users, subscriptions + 1)[:subscriptions]
+            if author != user
+        ))
+        self.log('Favorites, shopping carts and subscriptions created')
+        for chunk in batched(users, 500):
+            shopping_list.rebuild(chunk)
+        if recipes:
+            created = Recipe.objects.filter(
+                pk__range=(recipes[0], recipes[-1])
+            )
+            created.update(
+                favorites_count=count_subquery(FavoriteRecipe, 'recipe')
+            )
+            search.update_vectors(created)
+        if users:
+            CustomUser.objects.filter(
+                pk__range=(users[0], users[-1])
+            ).update(recipes_count=count_subquery(Recipe, 'author'))
+        bulk_changed.send(sender=Tag)
+        bulk_changed.send(sender=Recipe)
+        self.log(self.style.SUCCESS(
+            'Shopping lists, counters and search vectors updated'
+        ))
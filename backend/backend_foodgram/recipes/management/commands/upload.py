@@ -1,20 +1,92 @@
 import csv
+import json
+import re
+import time
+from functools import partial
+from itertools import islice
+from pathlib import Path
 
 from django.core import management
 
 from ...models import Ingredient
+from ...signals import bulk_changed
+
+JSON_SEPARATORS = re.compile(r'[\s\[,]*')
 
 
 class Command(management.base.BaseCommand):
-    help = 'Upload data'
+    help = 'Upload ingredients from a CSV, JSON or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            default='/app/data/ingredients.csv')
+        parser.add_argument(
+            '--format', choices=('csv', 'json', 'jsonl'),
+            help='File format, by default taken from the file extension'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            if row:
+                yield Ingredient(name=row[0], measure=row[1])
+
+    def read_json_item(self, item):
+        return Ingredient(
+            name=item['name'],
+            measure=item.get('measurement_unit', item.get('measure'))
+        )
+
+    def read_json(self, file, chunk_size=64 * 1024):
+        '''
+        Разбирает массив JSON по одному элементу, читая файл кусками
+        по chunk_size символов, а не целиком.
+        '''
+        decoder = json.JSONDecoder()
+        buffer, position = '', 0
+        for chunk in iter(partial(file.read, chunk_size), ''):
+            buffer = buffer[position:] + chunk
+            position = 0
+            while True:
+                position = JSON_SEPARATORS.match(buffer, position).end()
+                if position == len(buffer) or buffer[position] == ']':
+                    break
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Элемент обрезан концом куска, дочитываем файл.
+                    break
+                yield self.read_json_item(item)
+        if buffer[position:].strip() not in ('', ']'):
+            raise management.base.CommandError(
+                f'Invalid JSON near: {buffer[position:position + 50]!r}'
+            )
+
+    def read_jsonl(self, file):
+        for line in file:
+            if line.strip():
+                yield self.read_json_item(json.loads(line))
 
-    def handle(self, *args, **kwargs):
-        path_to_data = (
-            '/app/data/ingredients.csv'
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        reader = getattr(self, f'read_{file_format}', None)
+        if reader is None:
+            raise management.base.CommandError(
+                f'Unsupported file format: {file_format}'
+            )
+        start = time.perf_counter()
+        count_before = Ingredient.objects.count()
+        total = 0
+        with open(path, encoding='utf8') as file:
+            ingredients = reader(file)
+            while batch := list(islice(ingredients, options['batch_size'])):
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+        inserted = Ingredient.objects.count() - count_before
+        if inserted:
+            bulk_changed.send(sender=Ingredient)
+        self.stdout.write(
+            f'Inserted: {inserted}, skipped: {total - inserted}, '
+            f'time: {time.perf_counter() - start:.2f} s'
         )
-        with open(path_to_data, encoding='utf8') as f:
-            reader = csv.reader(f)
-            heads_of_column = ('name', 'measure')
-            for row in reader:
-                data_for_model = dict(zip(heads_of_column, row))
-                Ingredient.objects.create(**data_for_model)
@@ -0,0 +1,128 @@
+# Generated by Django 4.1.7 on 2026-10-18 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import recipes.validators
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoriteRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'избранные рецепты',
+                'verbose_name_plural': 'избранные рецепты',
+            },
+        ),
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('measure', models.CharField(max_length=20, verbose_name='Единицы измерения')),
+            ],
+            options={
+                'verbose_name': 'ингредиент',
+                'verbose_name_plural': 'ингредиенты',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Quantity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(validators=[recipes.validators.validate_minimum], verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+            ],
+            options={
+                'verbose_name': 'запись о количестве ингредиента в рецепте',
+                'verbose_name_plural': 'количество ингредиентов',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, validators=[recipes.validators.validate_string], verbose_name='Название блюда')),
+                ('image', models.ImageField(upload_to='recipes/images/', verbose_name='Фото готового блюда')),
+                ('text', models.TextField(help_text='Опишите порядок приготовления блюда', validators=[recipes.validators.validate_string], verbose_name='Описание приготовления блюда')),
+                ('cooking_time', models.PositiveSmallIntegerField(validators=[recipes.validators.validate_minimum], verbose_name='Время приготовления в минутах')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('ingredients', models.ManyToManyField(related_name='recipes', through='recipes.Quantity', to='recipes.ingredient')),
+            ],
+            options={
+                'verbose_name': 'рецепт',
+                'verbose_name_plural': 'рецепты',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Тег')),
+                ('color', models.CharField(choices=[('#ff0000', 'Red'), ('#00ff00', 'Green'), ('#0000ff', 'Blue')], max_length=7, verbose_name='Цвет')),
+                ('slug', models.SlugField(max_length=200, unique=True, verbose_name='SLUG')),
+            ],
+            options={
+                'verbose_name': 'тег',
+                'verbose_name_plural': 'теги',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipes', models.ManyToManyField(related_name='shopping_carts', to='recipes.recipe')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'список покупок',
+                'verbose_name_plural': 'список покупок',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(related_name='recipes', to='recipes.tag'),
+        ),
+        migrations.AddField(
+            model_name='quantity',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measure'), name='unique_together_name_measure'),
+        ),
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='users', to='recipes.recipe', verbose_name='рецепт'),
+        ),
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_recipes', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='quantity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_in)recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='uniqu_favorite_recipe'),
+        ),
+    ]
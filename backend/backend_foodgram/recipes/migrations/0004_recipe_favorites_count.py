@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from recipes.counters import count_subquery
+
+
+def fill_favorites_count(apps, schema_editor):
+    '''Считает добавления в избранное, сделанные до появления счётчика.'''
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count_subquery(FavoriteRecipe, 'recipe')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_alter_recipe_options_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_favorites_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    '''
+    ShoppingCartRecipe занимает существующую таблицу связи корзин
+    с рецептами: модель добавляется только в состояние, а в таблицу
+    добавляется колонка added_at. Строкам, которые уже лежат в корзинах,
+    проставляется время миграции.
+    '''
+
+    dependencies = [
+        ('recipes', '0004_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ShoppingCartRecipe',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe')),
+                        ('shoppingcart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.shoppingcart')),
+                    ],
+                    options={
+                        'verbose_name': 'рецепт в списке покупок',
+                        'verbose_name_plural': 'рецепты в списках покупок',
+                        'db_table': 'recipes_shoppingcart_recipes',
+                        'unique_together': {('shoppingcart', 'recipe')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='shoppingcart',
+                    name='recipes',
+                    field=models.ManyToManyField(related_name='shopping_carts', through='recipes.ShoppingCartRecipe', to='recipes.recipe'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shoppingcartrecipe',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name='shoppingcartrecipe',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartrecipe',
+            constraint=models.UniqueConstraint(fields=('shoppingcart', 'recipe'), name='unique_shopping_cart_recipe'),
+        ),
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='рецепт')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчёта')),
+            ],
+            options={
+                'verbose_name': 'рейтинг рецепта',
+                'verbose_name_plural': 'рейтинг рецептов',
+                'ordering': ('-score', 'recipe'),
+                'indexes': [models.Index(fields=['-score', 'recipe'], name='recipe_ranking_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+import recipes.indexes
+from recipes import search
+
+
+def fill_search_vectors(apps, schema_editor):
+    '''Заполняет search_vector у рецептов, созданных до поиска.'''
+    Quantity = apps.get_model('recipes', 'Quantity')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    search.update_vectors(Recipe.objects.all(), Quantity)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppingcartrecipe_reciperanking_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=recipes.indexes.SearchVectorIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favoriterecipe',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='users', to='recipes.recipe', verbose_name='рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='quantity',
+            name='ingredient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcartrecipe',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='recipes.recipe'),
+        ),
+        migrations.AddIndex(
+            model_name='favoriterecipe',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoriterecipe',
+            index=models.Index(fields=['added_at', 'recipe'], name='favorite_added_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quantity',
+            index=models.Index(fields=['ingredient', 'recipe', 'amount'], name='quantity_ingredient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartrecipe',
+            index=models.Index(fields=['recipe', 'shoppingcart'], name='cart_recipe_cart_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcartrecipe',
+            index=models.Index(fields=['added_at', 'recipe'], name='cart_added_at_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from users.models import CustomUser
 
+from .indexes import SearchVectorIndex
 from .validators import validate_minimum, validate_string
 
 
@@ -44,7 +46,8 @@ class Tag(models.Model):
 
 class Recipe(models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
-                               verbose_name='Автор', related_name='recipes')
+                               verbose_name='Автор', related_name='recipes',
+                               db_index=False)
     name = models.CharField(max_length=settings.MAX_LENGTH_NAME,
                             unique=True, verbose_name='Название блюда',
                             validators=(validate_string, ))
@@ -62,11 +65,26 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(verbose_name='Дата добавления рецепта',
                                     auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('-favorites_count', '-pub_date', '-id'),
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+            SearchVectorIndex(fields=('search_vector',),
+                              name='recipe_search_vector_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -75,7 +93,7 @@ class Recipe(models.Model):
 class Quantity(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
-                                   verbose_name='Ингредиент')
+                                   verbose_name='Ингредиент', db_index=False)
     amount = models.PositiveIntegerField(verbose_name='Количество',
                                          blank=False,
                                          null=False,
@@ -88,6 +106,10 @@ class Quantity(models.Model):
             models.UniqueConstraint(fields=('recipe', 'ingredient'),
                                     name='unique_ingredient_in)recipe')
         ]
+        indexes = [
+            models.Index(fields=('ingredient', 'recipe', 'amount'),
+                         name='quantity_ingredient_idx')
+        ]
 
     def __str__(self):
         return (f'Рецепт {self.recipe.name} '
@@ -97,7 +119,8 @@ class Quantity(models.Model):
 
 class ShoppingCart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
-    recipes = models.ManyToManyField(Recipe, related_name='shopping_carts')
+    recipes = models.ManyToManyField(Recipe, related_name='shopping_carts',
+                                     through='ShoppingCartRecipe')
 
     class Meta:
         verbose_name = 'список покупок'
@@ -107,13 +130,42 @@ class ShoppingCart(models.Model):
         return (f'Список покупок юзера {self.user.username}')
 
 
+class ShoppingCartRecipe(models.Model):
+    shoppingcart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               db_index=False)
+    added_at = models.DateTimeField(verbose_name='Дата добавления',
+                                    auto_now_add=True)
+
+    class Meta:
+        db_table = 'recipes_shoppingcart_recipes'
+        verbose_name = 'рецепт в списке покупок'
+        verbose_name_plural = 'рецепты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(fields=('shoppingcart', 'recipe'),
+                                    name='unique_shopping_cart_recipe')
+        ]
+        indexes = [
+            models.Index(fields=('recipe', 'shoppingcart'),
+                         name='cart_recipe_cart_idx'),
+            models.Index(fields=('added_at', 'recipe'),
+                         name='cart_added_at_idx'),
+        ]
+
+    def __str__(self):
+        return (f'Рецепт {self.recipe.name} '
+                f'в списке покупок юзера {self.shoppingcart.user.username}')
+
+
 class FavoriteRecipe(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
                              related_name='favorite_recipes',
                              verbose_name='пользователь')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='users',
-                               verbose_name='рецепт')
+                               verbose_name='рецепт', db_index=False)
+    added_at = models.DateTimeField(verbose_name='Дата добавления',
+                                    auto_now_add=True)
 
     class Meta:
         verbose_name = 'избранные рецепты'
@@ -122,7 +174,54 @@ class FavoriteRecipe(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='uniqu_favorite_recipe')
         ]
+        indexes = [
+            models.Index(fields=('recipe', 'user'),
+                         name='favorite_recipe_user_idx'),
+            models.Index(fields=('added_at', 'recipe'),
+                         name='favorite_added_at_idx'),
+        ]
 
     def __str__(self):
         return (f'Рецепт {self.recipe.name} '
                 f'в избранном юзера {self.user.username}')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   verbose_name='Ингредиент')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'ingredient'),
+                                    name='unique_shopping_list_item')
+        ]
+
+    def __str__(self):
+        return (f'{self.ingredient.name}: {self.amount} '
+                f'{self.ingredient.measure}')
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='ranking',
+                                  verbose_name='рецепт')
+    score = models.FloatField(verbose_name='Рейтинг')
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        ordering = ('-score', 'recipe')
+        verbose_name = 'рейтинг рецепта'
+        verbose_name_plural = 'рейтинг рецептов'
+        indexes = [
+            models.Index(fields=('-score', 'recipe'),
+                         name='recipe_ranking_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe.name}: {self.score:.2f}'
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from .models import Quantity, Recipe
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def update_vectors(recipes, quantity_model=Quantity):
+    '''
+    Пересчитывает search_vector рецептов по названию, описанию
+    и названиям ингредиентов. На других базах ничего не делает.
+    В миграциях передаётся историческая модель Quantity.
+    '''
+    if not is_supported():
+        return
+    from django.contrib.postgres.aggregates import StringAgg
+    from django.contrib.postgres.search import SearchVector
+
+    config = settings.SEARCH_CONFIG
+    ingredient_names = Subquery(
+        quantity_model.objects.filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names'),
+        output_field=TextField()
+    )
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+        + SearchVector(Coalesce(ingredient_names, Value(''),
+                                output_field=TextField()),
+                       weight='C', config=config)
+    ))
+
+
+class PendingVectors(set):
+    '''
+    id рецептов, чьи search_vector пересчитываются одним запросом
+    после коммита транзакции.
+    '''
+    done = False
+
+    def __call__(self):
+        self.done = True
+        update_vectors(Recipe.objects.filter(pk__in=self))
+
+
+def schedule_update(recipe_ids):
+    '''
+    Откладывает пересчёт search_vector рецептов до коммита текущей
+    транзакции. Сколько бы раз рецепт ни менялся в транзакции, его
+    вектор пересчитается один раз.
+    '''
+    if not is_supported():
+        return
+    pending = getattr(connection, 'pending_search_vectors', None)
+    # После отката колбэк убирается из run_on_commit, а после вызова
+    # помечен done, тогда копится новый набор. Вне транзакции колбэк
+    # вызывается сразу.
+    if pending is not None and not pending.done and any(
+        item[1] is pending for item in connection.run_on_commit
+    ):
+        pending.update(recipe_ids)
+        return
+    pending = connection.pending_search_vectors = PendingVectors(recipe_ids)
+    transaction.on_commit(pending)
+
+
+def search(queryset, text):
+    '''
+    Рецепты, подходящие под поисковую строку. В PostgreSQL ищет
+    по search_vector и добавляет аннотацию search_rank, в остальных
+    базах ищет LIKE по названию, описанию и ингредиентам.
+    '''
+    if is_supported():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(text, config=settings.SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+    return queryset.filter(
+        Q(name__icontains=text)
+        | Q(text__icontains=text)
+        | Exists(Quantity.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=text
+        ))
+    )
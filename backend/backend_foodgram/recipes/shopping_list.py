@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import Quantity, ShoppingCart, ShoppingListItem
+
+
+def recipe_amounts(recipe_ids):
+    '''
+    Возвращает суммарное количество каждого ингредиента в рецептах
+    в виде {id ингредиента: количество}.
+    '''
+    return dict(
+        Quantity.objects.filter(recipe__in=recipe_ids)
+        .order_by()
+        .values_list('ingredient')
+        .annotate(total=Sum('amount'))
+    )
+
+
+def apply_deltas(user_ids, deltas):
+    '''
+    Прибавляет к спискам покупок пользователей изменения количества
+    ингредиентов {id ингредиента: изменение}. Позиции, сумма которых
+    стала нулевой, удаляются.
+    '''
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=pk, amount=0)
+             for user_id in user_ids
+             for pk, delta in deltas.items() if delta > 0),
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user__in=user_ids, ingredient__in=deltas
+        )
+        items.update(amount=F('amount') + Case(
+            *(When(ingredient=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            default=Value(0), output_field=IntegerField()
+        ))
+        items.filter(amount__lte=0).delete()
+
+
+def add_recipes(user_ids, recipe_ids):
+    apply_deltas(user_ids, recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_ids, recipe_ids):
+    apply_deltas(user_ids, {
+        pk: -amount for pk, amount in recipe_amounts(recipe_ids).items()
+    })
+
+
+def change_recipe(recipe_id, deltas):
+    '''
+    Переносит изменение ингредиентов рецепта в списки покупок всех
+    пользователей, у которых рецепт лежит в корзине.
+    '''
+    if not any(deltas.values()):
+        return
+    apply_deltas(
+        ShoppingCart.objects.filter(recipes=recipe_id)
+        .values_list('user', flat=True),
+        deltas
+    )
+
+
+def calculate(user_ids=None):
+    '''
+    Считает списки покупок заново по корзинам пользователей.
+    Возвращает {(id пользователя, id ингредиента): количество}.
+    '''
+    # Оба условия в одном filter(), иначе по корзинам будет два JOIN
+    # и количества умножатся.
+    carts = {'recipe__shopping_carts__isnull': False}
+    if user_ids is not None:
+        carts = {'recipe__shopping_carts__user__in': user_ids}
+    quantities = Quantity.objects.filter(**carts)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in quantities
+        .order_by()
+        .values_list('recipe__shopping_carts__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .iterator()
+    }
+
+
+def stored(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in items.values_list(
+            'user', 'ingredient', 'amount'
+        ).iterator()
+    }
+
+
+def verify(user_ids=None):
+    '''
+    Сравнивает таблицу со списками покупок с пересчётом по корзинам.
+    Возвращает расхождения {(пользователь, ингредиент): (в таблице,
+    ожидается)}.
+    '''
+    expected = calculate(user_ids)
+    actual = stored(user_ids)
+    return {
+        key: (actual.get(key), expected.get(key))
+        for key in expected.keys() | actual.keys()
+        if actual.get(key) != expected.get(key)
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids=None, batch_size=1000):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=amount)
+         for (user_id, ingredient_id), amount in calculate(user_ids).items()),
+        batch_size=batch_size
+    )
@@ -0,0 +1,125 @@
+from django.db.models import F, QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from users.models import CustomUser
+
+from . import search, shopping_list
+from .models import Ingredient, Quantity, Recipe, ShoppingCart
+
+# Строки sender изменены через bulk_create, который не отправляет
+# post_save. Его отправляют команды массовой загрузки.
+bulk_changed = Signal()
+
+
+@receiver(m2m_changed, sender=ShoppingCart.recipes.through)
+def update_shopping_list(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        recipe_ids = [instance.pk]
+        carts = ShoppingCart.objects.filter(recipes=instance)
+        if pk_set is not None:
+            carts = ShoppingCart.objects.filter(pk__in=pk_set)
+        user_ids = carts.values_list('user', flat=True)
+    else:
+        user_ids = [instance.user_id]
+        recipe_ids = pk_set
+        if pk_set is None:
+            recipe_ids = instance.recipes.values_list('pk', flat=True)
+    if action == 'post_add':
+        shopping_list.add_recipes(user_ids, recipe_ids)
+    else:
+        shopping_list.remove_recipes(user_ids, recipe_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_carts(sender, instance, **kwargs):
+    instance.shopping_carts.clear()
+
+
+@receiver(pre_save, sender=Quantity)
+def remember_quantity(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if instance.pk is not None and not raw:
+        instance._previous = Quantity.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient', 'amount').first()
+
+
+@receiver(post_save, sender=Quantity)
+def update_shopping_list_on_quantity_save(sender, instance, raw=False,
+                                          **kwargs):
+    if raw:
+        return
+    deltas = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        ingredient_id, amount = previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    shopping_list.change_recipe(instance.recipe_id, deltas)
+
+
+def deleted_with_recipe(origin):
+    '''Удаление идёт каскадом от удаления самих рецептов.'''
+    return isinstance(origin, Recipe) or (
+        isinstance(origin, QuerySet) and origin.model is Recipe
+    )
+
+
+@receiver(post_delete, sender=Quantity)
+def update_shopping_list_on_quantity_delete(sender, instance, origin=None,
+                                            **kwargs):
+    # Рецепт до удаления уже убран из корзин в
+    # remove_recipe_from_shopping_carts.
+    if not deleted_with_recipe(origin):
+        shopping_list.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CustomUser.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    CustomUser.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector_on_recipe_save(sender, instance, raw=False,
+                                        update_fields=None, **kwargs):
+    if raw or update_fields is not None and not {'name', 'text'} & set(
+        update_fields
+    ):
+        return
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=Quantity)
+def update_search_vector_on_quantity_save(sender, instance, raw=False,
+                                          **kwargs):
+    if not raw:
+        search.schedule_update([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Quantity)
+def update_search_vector_on_quantity_delete(sender, instance, origin=None,
+                                            **kwargs):
+    if not deleted_with_recipe(origin):
+        search.schedule_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_on_ingredient_change(sender, instance, raw=False,
+                                              **kwargs):
+    if not raw:
+        search.update_vectors(Recipe.objects.filter(ingredients=instance))
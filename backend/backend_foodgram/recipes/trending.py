@@ -0,0 +1,62 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FavoriteRecipe, RecipeRanking, ShoppingCartRecipe
+
+SOURCES = (FavoriteRecipe, ShoppingCartRecipe)
+
+
+def daily_counts(model, since):
+    '''
+    Количество добавлений каждого рецепта по дням начиная с since
+    в виде (id рецепта, день, количество).
+    '''
+    return (
+        model.objects.filter(added_at__gte=since)
+        .annotate(day=TruncDate('added_at'))
+        .order_by()
+        .values_list('recipe', 'day')
+        .annotate(count=Count('pk'))
+    )
+
+
+def calculate(now=None, window=None, half_life=None):
+    '''
+    Рейтинг рецептов {id рецепта: очки}. Каждое добавление в избранное
+    или в список покупок даёт очко, которое уменьшается вдвое каждые
+    half_life дней.
+    '''
+    now = now or timezone.now()
+    window = window or settings.TRENDING_WINDOW_DAYS
+    half_life = half_life or settings.TRENDING_HALF_LIFE_DAYS
+    today = now.date()
+    scores = Counter()
+    for model in SOURCES:
+        for recipe_id, day, count in daily_counts(
+            model, now - timedelta(days=window)
+        ):
+            age = (today - day).days
+            scores[recipe_id] += count * 0.5 ** (age / half_life)
+    return scores
+
+
+@transaction.atomic
+def rebuild(now=None, window=None, half_life=None, size=None):
+    '''
+    Пересчитывает таблицу рейтинга, оставляя size лучших рецептов.
+    '''
+    now = now or timezone.now()
+    scores = calculate(now, window, half_life)
+    RecipeRanking.objects.all().delete()
+    return len(RecipeRanking.objects.bulk_create(
+        RecipeRanking(recipe_id=recipe_id, score=score, computed_at=now)
+        for recipe_id, score in scores.most_common(
+            size or settings.TRENDING_SIZE
+        )
+    ))
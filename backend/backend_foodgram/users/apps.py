@@ -1,5 +1,4 @@
 from django.apps import AppConfig
-from django.core.signals import setting_changed
 
 
 class UsersConfig(AppConfig):
@@ -8,5 +7,4 @@ class UsersConfig(AppConfig):
     verbose_name = 'Пользователи'
 
     def ready(self):
-        from .signals import create_profile
-        setting_changed.connect(create_profile)
+        from . import signals  # noqa: F401
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from recipes.counters import count_subquery
+
+
+def fill_recipes_count(apps, schema_editor):
+    '''Считает рецепты авторов, созданных до появления счётчика.'''
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CustomUser.objects.update(
+        recipes_count=count_subquery(Recipe, 'author')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(fill_recipes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_customuser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscribe',
+            name='subscriber',
+            field=models.ForeignKey(db_index=False, help_text='Выберите кто подписывается на автора', on_delete=django.db.models.deletion.CASCADE, related_name='authors', to=settings.AUTH_USER_MODEL, verbose_name='подписчик'),
+        ),
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['subscriber', 'author'], name='subscribe_subscriber_idx'),
+        ),
+    ]
@@ -21,6 +21,9 @@ class CustomUser(AbstractUser):
     password = models.CharField(
         max_length=settings.MAX_LENGTH_CHARFIELD_CUSTOMUSER
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество рецептов'
+    )
     REQUIRED_FIELDS = ('first_name', 'last_name', 'username')
     USERNAME_FIELD = 'email'
 
@@ -40,7 +43,7 @@ class Subscribe(models.Model):
                                help_text='Выберите автора для подписки')
     subscriber = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name='authors',
-        verbose_name='подписчик',
+        verbose_name='подписчик', db_index=False,
         help_text='Выберите кто подписывается на автора'
     )
 
@@ -55,6 +58,10 @@ class Subscribe(models.Model):
                 name='prevent_self_subscribe'
             )
         ]
+        indexes = [
+            models.Index(fields=('subscriber', 'author'),
+                         name='subscribe_subscriber_idx')
+        ]
 
     def __str__(self):
         return (f'{self.subscriber.username} подписан '